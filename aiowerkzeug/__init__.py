@@ -1,5 +1,4 @@
-from .local import context_coroutine, identify_future, patch_local, AsyncLocalManager, \
-    AsyncLocal, AsyncLocalStack, keep_context_factory
+import sys
 
 __author__ = 'alfred'
 __all__ = ['context_coroutine',
@@ -8,4 +7,25 @@ __all__ = ['context_coroutine',
            'AsyncLocalManager',
            'AsyncLocal',
            'AsyncLocalStack',
-           'keep_context_factory']
+           'keep_context_factory',
+           'SharedContext',
+           'run_in_executor']
+
+
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        # Local module (and werkzeug) is imported on first use, in order to keep startup fast.
+        if name not in __all__:
+            raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+        from . import local
+        value = getattr(local, name)
+        globals()[name] = value
+        return value
+
+    def __dir__():
+        return sorted(set(globals()) | set(__all__))
+
+else:  # pragma: no cover
+    from .local import context_coroutine, identify_future, patch_local, AsyncLocalManager, \
+        AsyncLocal, AsyncLocalStack, keep_context_factory, SharedContext, run_in_executor
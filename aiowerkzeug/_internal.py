@@ -0,0 +1,42 @@
+"""
+_internal.py
+
+Internal helpers. They are kept here in order to avoid to import werkzeug package on
+module loading, it imports its server and test client.
+"""
+import logging
+
+__author__ = 'alfred'
+
+
+_logger = None
+
+
+def _has_level_handler(logger):
+    level = logger.getEffectiveLevel()
+    current = logger
+    while current:
+        if any(handler.level <= level for handler in current.handlers):
+            return True
+        if not current.propagate:
+            break
+        current = current.parent
+    return False
+
+
+def _log(type, message, *args, **kwargs):
+    """
+    Logs a message to ``werkzeug`` logger, like :func:`werkzeug._internal._log` does.
+    Logger level is set to ``INFO`` and a stream handler is added when they are not
+    configured.
+    """
+    global _logger
+
+    if _logger is None:
+        _logger = logging.getLogger('werkzeug')
+        if _logger.level == logging.NOTSET:
+            _logger.setLevel(logging.INFO)
+        if not _has_level_handler(_logger):
+            _logger.addHandler(logging.StreamHandler())
+
+    getattr(_logger, type)(message.rstrip(), *args, **kwargs)
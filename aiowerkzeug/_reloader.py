@@ -1,9 +1,16 @@
+import ast
 import asyncio
+import importlib
+import importlib.util
 import os
 import sys
-from hachiko.hachiko import AIOEventHandler
-from werkzeug._internal import _log
+import sysconfig
+import time
+import tokenize
+import traceback
+from types import ModuleType
 from werkzeug._reloader import ReloaderLoop, _find_observable_paths
+from ._internal import _log
 
 __author__ = 'alfred'
 
@@ -14,11 +21,150 @@ EVENT_TYPE_CREATED = 'created'
 EVENT_TYPE_MODIFIED = 'modified'
 
 
+class ReloadableApplication:
+    """
+    WSGI application loaded from an import string. It could be rebuilt after its modules
+    are reloaded; requests in flight keep running on previous application.
+    """
+
+    def __init__(self, import_name):
+        self.import_name = import_name
+        self.module_name, sep, _ = import_name.partition(':')
+        if not sep:
+            self.module_name = import_name.rpartition('.')[0]
+        self.app = None
+        self.reload()
+
+    def reload(self):
+        from werkzeug.utils import import_string
+        self.app = import_string(self.import_name)
+
+    def __call__(self, environ, start_response):
+        return self.app(environ, start_response)
+
+
+_imports_cache = {}
+
+
+def get_imports(filename, package):
+    """
+    Returns names of modules imported by a source file, including imports inside functions.
+    Names imported from modules are included too, because they could be submodules.
+
+    :param filename: Source file.
+    :param package: Package of module, used to resolve relative imports.
+    :return: Set of module names.
+    """
+    try:
+        mtime = os.stat(filename).st_mtime_ns
+        cached = _imports_cache.get((filename, package))
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        with tokenize.open(filename) as f:
+            tree = ast.parse(f.read(), filename)
+    except (OSError, SyntaxError, ValueError):
+        return set()
+
+    imports = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            imports.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            base = node.module or ''
+            if node.level:
+                try:
+                    base = importlib.util.resolve_name('.' * node.level + base, package)
+                except (ImportError, ValueError):
+                    continue
+            imports.add(base)
+            imports.update(base + '.' + alias.name for alias in node.names if alias.name != '*')
+
+    _imports_cache[(filename, package)] = (mtime, imports)
+    return imports
+
+
+class ModuleGraph:
+    """
+    Import dependency graph of project modules. A module depends on modules imported on its
+    source and on modules found on its globals.
+    """
+
+    def __init__(self, project_paths=None):
+        self.project_paths = tuple(os.path.join(os.path.abspath(path), '')
+                                   for path in project_paths or [os.getcwd()])
+        paths = sysconfig.get_paths()
+        self.excluded_paths = tuple(os.path.join(os.path.abspath(paths[key]), '')
+                                    for key in ('stdlib', 'platstdlib', 'purelib', 'platlib'))
+        self.files = {}
+        self.dependents = {}
+
+    def is_project_module(self, module):
+        filename = getattr(module, '__file__', None)
+        if not filename:
+            return False
+        filename = os.path.abspath(filename)
+        return filename.startswith(self.project_paths) and not filename.startswith(self.excluded_paths)
+
+    def build(self):
+        modules = {name: module for name, module in list(sys.modules.items())
+                   if name != '__main__' and self.is_project_module(module)}
+        self.files = {os.path.abspath(module.__file__): name for name, module in modules.items()}
+        self.dependents = {name: set() for name in modules}
+
+        for name, module in modules.items():
+            dependencies = set()
+            filename = os.path.abspath(module.__file__)
+            if filename.endswith('.py'):
+                dependencies.update(get_imports(filename, module.__package__ or ''))
+
+            for value in list(vars(module).values()):
+                try:
+                    if isinstance(value, ModuleType):
+                        dependencies.add(value.__name__)
+                except Exception:
+                    # Proxies or broken objects could raise on any access.
+                    continue
+
+            for dependency in dependencies:
+                if dependency != name and dependency in self.dependents:
+                    self.dependents[dependency].add(name)
+
+    def get_reload_order(self, names):
+        """
+        Returns modules and their dependents, sorted in order to reload every module
+        after modules it depends on.
+
+        :param names: Changed module names.
+        :return: List of module names.
+        """
+        visited = set()
+        order = []
+
+        def visit(name):
+            visited.add(name)
+            for dependent in sorted(self.dependents.get(name, ())):
+                if dependent not in visited:
+                    visit(dependent)
+            order.append(name)
+
+        for name in sorted(names):
+            if name not in visited:
+                visit(name)
+
+        order.reverse()
+        return order
+
+
 class AIOReloaderLoop(ReloaderLoop):
 
-    def __init__(self, extra_files=None, interval=1, loop=None):
+    def __init__(self, extra_files=None, interval=1, loop=None, application=None):
+        """
+        :param application: :class:`~ReloadableApplication` rebuilt by reloaders which
+                            reload modules in process.
+        """
         super(AIOReloaderLoop, self).__init__(extra_files=extra_files, interval=interval)
         self.loop = loop
+        self.application = application
         self.process = None
 
     @asyncio.coroutine
@@ -48,6 +194,7 @@ class HachikoReloaderLoop(AIOReloaderLoop):
 
     def __init__(self, *args, **kwargs):
         super(HachikoReloaderLoop, self).__init__(*args, **kwargs)
+        from hachiko.hachiko import AIOEventHandler
         from watchdog.observers import Observer
         self.observable_paths = set()
 
@@ -91,6 +238,7 @@ class HachikoReloaderLoop(AIOReloaderLoop):
         self.observer_class = Observer
         self.event_handler = _CustomHandler(loop=self.loop)
         self.should_reload = asyncio.Event(loop=self.loop)
+        self.changed_files = set()
 
     @asyncio.coroutine
     def trigger_reload(self, filename):
@@ -98,6 +246,7 @@ class HachikoReloaderLoop(AIOReloaderLoop):
         # SystemExit here. https://github.com/gorakhargosh/watchdog/issues/294
         self.should_reload.set()
         filename = os.path.abspath(filename)
+        self.changed_files.add(filename)
         _log('info', ' * Detected change in %r, reloading' % filename)
 
     @asyncio.coroutine
@@ -131,6 +280,10 @@ class HachikoReloaderLoop(AIOReloaderLoop):
                 observer.unschedule(watch)
         self.observable_paths = paths
 
+        yield from self.wait_reload()
+
+    @asyncio.coroutine
+    def wait_reload(self):
         yield from self.should_reload.wait()
 
         sys.exit(3)
@@ -139,8 +292,67 @@ class HachikoReloaderLoop(AIOReloaderLoop):
         pass
 
 
+class InProcessReloaderLoop(HachikoReloaderLoop):
+    """
+    Reloader which reloads changed modules and their dependents in process, and it
+    swaps rebuilt application. Process is restarted when it fails.
+    """
+
+    def __init__(self, *args, project_paths=None, **kwargs):
+        super(InProcessReloaderLoop, self).__init__(*args, **kwargs)
+        self.project_paths = project_paths
+        self.name += ' (in process)'
+
+    @asyncio.coroutine
+    def wait_reload(self):
+        while True:
+            yield from self.should_reload.wait()
+            self.should_reload.clear()
+
+            filenames, self.changed_files = self.changed_files, set()
+            if not self.reload(filenames):
+                sys.exit(3)
+
+    def reload(self, filenames):
+        """
+        Reloads modules of changed files and rebuilds application.
+
+        :param filenames: Absolute paths of changed files.
+        :return: Whether reload succeeded. Otherwise process must be restarted.
+        """
+        if self.application is None or self.extra_files.intersection(filenames):
+            return False
+
+        start = time.monotonic()
+        graph = ModuleGraph(self.project_paths)
+        graph.build()
+        names = [graph.files[filename] for filename in filenames if filename in graph.files]
+        if not names:
+            # Changed files are not imported.
+            return True
+
+        order = graph.get_reload_order(names)
+        if self.application.module_name not in order:
+            # Application would keep objects of changed modules.
+            _log('info', ' * Application module %r does not depend on changed modules, restarting',
+                 self.application.module_name)
+            return False
+
+        try:
+            for name in order:
+                importlib.reload(sys.modules[name])
+            self.application.reload()
+        except Exception:
+            _log('error', ' * In process reload failed, restarting:\n%s', traceback.format_exc())
+            return False
+
+        _log('info', ' * Reloaded %d modules in %.1fms', len(order), (time.monotonic() - start) * 1000)
+        return True
+
+
 reloader_loops = {
-    'hachiko': HachikoReloaderLoop
+    'hachiko': HachikoReloaderLoop,
+    'inprocess': InProcessReloaderLoop
 }
 
 
@@ -148,11 +360,11 @@ reloader_loops['auto'] = reloader_loops['hachiko']
 
 
 def run_with_reloader(main_func, extra_files=None, interval=1,
-                      reloader_type='auto', loop=None):
+                      reloader_type='auto', loop=None, application=None):
 
     loop = loop or asyncio.get_event_loop()
 
-    reloader = reloader_loops[reloader_type](extra_files, interval, loop=loop)
+    reloader = reloader_loops[reloader_type](extra_files, interval, loop=loop, application=application)
 
     import signal
     loop.add_signal_handler(signal.SIGTERM, lambda *args: loop.stop())
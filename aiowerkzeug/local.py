@@ -4,11 +4,15 @@ local.py
 Helpers to allow use asyncio on werkzeug library.
 """
 import inspect
+import sys
+import threading
 from functools import wraps, partial
-from asyncio import futures, Task, ensure_future
+from asyncio import futures, Task, ensure_future, get_event_loop
 from asyncio.coroutines import CoroWrapper
 from werkzeug.local import Local, LocalStack, LocalManager
 
+_executor_binding = threading.local()
+
 
 def identify_future(fut=None):
     """
@@ -20,6 +24,10 @@ def identify_future(fut=None):
     :return: int
     """
     if fut is None:
+        # Executor workers have no task, they use identifier bound by :func:`~run_in_executor`.
+        ident = getattr(_executor_binding, 'ident', None)
+        if ident is not None:
+            return ident
         fut = Task.current_task()
     return id(fut)
 
@@ -99,12 +107,16 @@ def context_coroutine(func, ctx):
     return wrapper
 
 
-def keep_context_factory(func, ctx):
+def keep_context_factory(func, ctx, reuse=False):
     """Decorator factory to run coroutines or async functions inside context.
 
     Simplified version of :meth:`~context_coroutine` factory. It must work in same
     way. But its code is more simple.
 
+    When ``reuse`` is ``True`` context object is built only once per task and it is
+    shared by all nested decorated calls running on same task. It is entered by the
+    outermost call and exited when last one finishes.
+
     **Example:**
 
     .. code-block:: python
@@ -117,7 +129,10 @@ def keep_context_factory(func, ctx):
 
     @wraps(func)
     def inner(*args, **kwargs):
-        ctx_obj = ctx()
+        if reuse:
+            ctx_obj = SharedContext(ctx)
+        else:
+            ctx_obj = ctx()
 
         async def wrapper():
             with ctx_obj:
@@ -128,9 +143,9 @@ def keep_context_factory(func, ctx):
     return inner
 
 
-def async_task_with_context(fut, ctx, callback=None, loop=None):
+def async_task_with_context(fut, ctx, callback=None, loop=None, reuse=False):
 
-    decorator = partial(keep_context_factory, ctx=ctx)
+    decorator = partial(keep_context_factory, ctx=ctx, reuse=reuse)
 
     @decorator
     async def inner():
@@ -143,6 +158,77 @@ def async_task_with_context(fut, ctx, callback=None, loop=None):
     return ensure_future(inner(), loop=loop)
 
 
+def _get_storage_local(local):
+    if isinstance(local, str):
+        from werkzeug.utils import import_string
+        local = import_string(local)
+    if isinstance(local, LocalStack):
+        local = local._local
+    return local
+
+
+def _snapshot_local(local, ident):
+    values = dict(local.__storage__.get(ident, {}))
+    if 'stack' in values:
+        # Stacks must not be shared, worker pushes or pops must not change task stack.
+        values['stack'] = list(values['stack'])
+    return values
+
+
+def _run_with_locals(func, snapshots, args):
+    token = object()
+    ident = id(token)
+    storages = []
+    for local, values in snapshots:
+        local = _get_storage_local(local)
+        local.__storage__[ident] = values
+        storages.append(local.__storage__)
+
+    _executor_binding.ident = ident
+    try:
+        return func(*args)
+    finally:
+        del _executor_binding.ident
+        for storage in storages:
+            storage.pop(ident, None)
+
+
+def run_in_executor(executor, func, *args, local_objects=None, loop=None):
+    """
+    Run function in executor keeping values of locals from current task.
+
+    Values of locals are copied from current task and they are bound to worker
+    thread while function is running. They are released afterwards, so changes
+    made in worker are not seen by task.
+
+    When ``executor`` is a :class:`concurrent.futures.ProcessPoolExecutor` local objects must be
+    import strings (``'package.module:local_name'``), and their values will be pickled.
+
+    :param executor: Executor to use. ``None`` means loop default executor.
+    :type executor: concurrent.futures.Executor or None
+    :param func: Function to run.
+    :param local_objects: Locals to keep. They could be :class:`werkzeug.local.Local` or
+                          :class:`werkzeug.local.LocalStack` objects or import strings.
+    :type local_objects: list
+    :param loop: Event loop.
+    :return: asyncio.Future
+    """
+    loop = loop or get_event_loop()
+    ident = identify_future()
+
+    # Process executor module is not imported if it is not used, it is slow to import.
+    process_module = sys.modules.get('concurrent.futures.process')
+    is_process_executor = process_module is not None and isinstance(executor, process_module.ProcessPoolExecutor)
+
+    snapshots = []
+    for local in local_objects or []:
+        if is_process_executor and not isinstance(local, str):
+            raise ValueError("Locals must be import strings when process executor is used")
+        snapshots.append((local, _snapshot_local(_get_storage_local(local), ident)))
+
+    return loop.run_in_executor(executor, partial(_run_with_locals, func, snapshots, args))
+
+
 class AsyncLocal(Local):
 
     def __init__(self):
@@ -164,5 +250,69 @@ class AsyncLocalStack(LocalStack):
 
 class AsyncLocalManager(LocalManager):
 
-    def make_task_with_ctx_factory(self, ctx, loop=None):
-        return partial(async_task_with_context, ctx=ctx, callback=self.cleanup, loop=loop)
+    def make_task_with_ctx_factory(self, ctx, loop=None, reuse=False):
+        return partial(async_task_with_context, ctx=ctx, callback=self.cleanup, loop=loop, reuse=reuse)
+
+    def run_in_executor(self, executor, func, *args, loop=None):
+        return run_in_executor(executor, func, *args, local_objects=self.locals, loop=loop)
+
+
+_shared_contexts = AsyncLocal()
+
+
+class SharedContext:
+    """
+    Context manager which shares a context object between all users on same task.
+
+    Context objects are registered by factory on current task. First one entering
+    builds context object and enters it. Nested ones just increase a reference counter.
+    Context object is exited and unregistered when reference counter drops to zero.
+
+    Context objects are never shared between tasks: a new task builds its own one,
+    because most context managers could not be entered twice at same time.
+    """
+
+    def __init__(self, ctx):
+        """
+        :param ctx: It must be a callable that returns a context manager. It is used
+                    as key to share context objects.
+        """
+        self.ctx = ctx
+
+    @staticmethod
+    def get_context_object(ctx):
+        """
+        Returns context object built by factory ``ctx`` on current task or ``None``.
+        """
+        try:
+            return _shared_contexts.entries[ctx][0]
+        except (AttributeError, KeyError):
+            return None
+
+    def __enter__(self):
+        try:
+            entries = _shared_contexts.entries
+        except AttributeError:
+            entries = _shared_contexts.entries = {}
+
+        try:
+            entries[self.ctx][1] += 1
+            return
+        except KeyError:
+            pass
+
+        ctx_obj = self.ctx()
+        ctx_obj.__enter__()
+        entries[self.ctx] = [ctx_obj, 1]
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        entries = _shared_contexts.entries
+        entry = entries[self.ctx]
+        entry[1] -= 1
+        if entry[1]:
+            return False
+
+        del entries[self.ctx]
+        if not entries:
+            _shared_contexts.__release_local__()
+        return entry[0].__exit__(exc_type, exc_val, exc_tb)
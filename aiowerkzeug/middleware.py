@@ -0,0 +1,711 @@
+"""
+middleware.py
+
+WSGI middlewares to be used with :func:`aiowerkzeug.serving.run_simple`.
+"""
+import asyncio
+import mimetypes
+import time
+import traceback
+import zlib
+from collections import OrderedDict
+from io import BytesIO
+from werkzeug.http import parse_accept_header
+from ._internal import _log
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+__author__ = 'alfred'
+
+
+if brotli is not None:
+    ENCODINGS = ('br', 'gzip')
+else:  # pragma: no cover
+    ENCODINGS = ('gzip',)
+
+
+def select_encoding(environ, encodings=ENCODINGS):
+    """
+    Returns first encoding accepted by client, or ``None``.
+
+    :param environ: WSGI environ.
+    :param encodings: Available encodings sorted by preference.
+    :return: str or None
+    """
+    accept = parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING', ''))
+    for encoding in encodings:
+        if accept.quality(encoding):
+            return encoding
+    return None
+
+
+class BrotliCompressor:
+    """
+    Wrapper to use brotli compressor with same interface as :func:`zlib.compressobj`.
+    """
+
+    def __init__(self, quality=5):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.finish()
+
+
+class CompressionMiddleware:
+    """
+    WSGI middleware which compresses responses using gzip or brotli.
+
+    Bodies smaller than ``min_size`` are not compressed, neither responses already
+    encoded or with a not compressible content type. Chunks are joined until they reach
+    ``offload_size`` and then they are compressed on ``executor``, so event loop is not
+    blocked even by bodies streamed in small chunks. They are yielded as futures, so it
+    must be served by :class:`~aiowerkzeug.serving.WSGIServerProtocol`.
+
+    Strong ``ETag`` of compressed responses is made weak, because compressed
+    representation is not byte-identical to original one.
+    """
+
+    compressible_types = ('text/', 'application/json', 'application/javascript', 'application/xml',
+                          'application/xhtml+xml', 'application/rss+xml', 'image/svg+xml')
+
+    def __init__(self, app, min_size=500, offload_size=16384, level=6, brotli_quality=5,
+                 executor=None, loop=None):
+        """
+        :param app: WSGI application to wrap.
+        :param min_size: Minimum body size to compress.
+        :param offload_size: Minimum data size to compress on executor. Smaller chunks are
+                             joined until they reach it.
+        :param level: Gzip compression level.
+        :param brotli_quality: Brotli compression quality.
+        :param executor: Executor to use. ``None`` means loop default executor.
+        :param loop: Event loop.
+        """
+        self.app = app
+        self.min_size = min_size
+        self.offload_size = offload_size
+        self.level = level
+        self.brotli_quality = brotli_quality
+        self.executor = executor
+        self.loop = loop
+
+    def make_compressor(self, encoding):
+        if encoding == 'br':
+            return BrotliCompressor(self.brotli_quality)
+        return zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def should_compress(self, status, headers):
+        """
+        Returns whether response must be compressed. It returns ``None`` when body
+        length is unknown, so it must be decided when body is read.
+        """
+        if status[:1] != '2' or status[:3] in ('204', '206'):
+            return False
+
+        content_type = ''
+        length = None
+        for name, value in headers:
+            name = name.lower()
+            if name == 'content-encoding':
+                return False
+            elif name == 'content-type':
+                content_type = value
+            elif name == 'content-length':
+                try:
+                    length = int(value)
+                except ValueError:
+                    pass
+            elif name == 'cache-control' and 'no-transform' in value:
+                return False
+
+        if not content_type.startswith(self.compressible_types):
+            return False
+        if length is not None:
+            return length >= self.min_size
+        return None
+
+    def compress(self, compressor, data):
+        if len(data) >= self.offload_size:
+            loop = self.loop or asyncio.get_event_loop()
+            return loop.run_in_executor(self.executor, compressor.compress, data)
+        return compressor.compress(data)
+
+    def __call__(self, environ, start_response):
+        encoding = select_encoding(environ)
+        if encoding is None or environ['REQUEST_METHOD'] == 'HEAD':
+            return self.app(environ, start_response)
+
+        response = CompressedResponse(self, encoding, start_response)
+        response.result = self.app(environ, response.start_response)
+        return response
+
+
+class CompressedResponse:
+    """
+    Response iterable used by :class:`~CompressionMiddleware`. Upstream ``start_response``
+    is called when compression has been decided.
+
+    Futures yielded by wrapped application are chained: a future is yielded instead,
+    which is resolved with processed result. So applications could call
+    ``start_response`` lazily, when their first future is resolved.
+    """
+
+    def __init__(self, middleware, encoding, start_response):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.result = None
+        self.status = None
+        self.headers = None
+        self.exc_info = None
+        self.compressor = None
+        self.compressed = False
+        self.started = False
+        self.buffered = []
+        self.size = 0
+        self.pending = []
+        self.pending_size = 0
+        self._start_response = start_response
+
+    def start_response(self, status, headers, exc_info=None):
+        if exc_info and self.started:
+            return self._start_response(status, headers, exc_info)
+
+        self.status = status
+        self.headers = headers
+        self.exc_info = exc_info
+        self.compressed = self.middleware.should_compress(status, headers)
+        return self.write
+
+    def write(self, data):
+        # Data written using legacy write callable is not compressed.
+        if not self.started:
+            self.compressed = False
+            self.begin()
+        self._write(data)
+
+    def begin(self):
+        self.started = True
+        headers = self.headers
+        if self.compressed:
+            self.compressor = self.middleware.make_compressor(self.encoding)
+            headers = []
+            for name, value in self.headers:
+                lname = name.lower()
+                if lname == 'content-length':
+                    continue
+                elif lname == 'etag' and not value.startswith('W/'):
+                    value = 'W/' + value
+                headers.append((name, value))
+            headers.append(('Content-Encoding', self.encoding))
+            headers.append(('Vary', 'Accept-Encoding'))
+        self._write = self._start_response(self.status, headers, self.exc_info)
+        self.exc_info = None
+
+    def process(self, data):
+        """
+        Processes a chunk of wrapped application.
+
+        :return: Data to send, a future or ``None`` when nothing must be sent yet.
+        """
+        if not data:
+            # Application could yield empty data before calling start_response.
+            return None
+
+        if self.compressed is None:
+            # Body length unknown, it is buffered until it is big enough.
+            self.buffered.append(data)
+            self.size += len(data)
+            if self.size < self.middleware.min_size:
+                return None
+            self.compressed = True
+            data = b''.join(self.buffered)
+            self.buffered = None
+
+        if not self.started:
+            self.begin()
+        if self.compressed:
+            return self.compress(data)
+        return data
+
+    def compress(self, data):
+        # Small chunks are joined, so streamed bodies are compressed on executor too.
+        self.pending.append(data)
+        self.pending_size += len(data)
+        if self.pending_size < self.middleware.offload_size:
+            return None
+
+        data = b''.join(self.pending)
+        self.pending = []
+        self.pending_size = 0
+        return self.middleware.compress(self.compressor, data)
+
+    async def process_future(self, fut):
+        data = self.process(await fut)
+        if isinstance(data, asyncio.Future):
+            data = await data
+        return data or b''
+
+    def finish(self):
+        """
+        Starts response if it is not started yet and returns pending data.
+        """
+        if not self.started:
+            if self.compressed is None:
+                self.compressed = False
+                self.headers = self.headers + [('Content-Length', str(self.size))]
+            self.begin()
+            if self.buffered:
+                return b''.join(self.buffered)
+
+        if self.compressed:
+            data = b''.join(self.pending)
+            self.pending = []
+            return self.compressor.compress(data) + self.compressor.flush()
+        return None
+
+    def __iter__(self):
+        for data in self.result:
+            if isinstance(data, asyncio.Future):
+                yield asyncio.ensure_future(self.process_future(data))
+                continue
+
+            data = self.process(data)
+            if data is not None:
+                yield data
+
+        data = self.finish()
+        if data is not None:
+            yield data
+
+    def close(self):
+        if hasattr(self.result, 'close'):
+            self.result.close()
+
+
+class StaticFilesMiddleware:
+    """
+    WSGI middleware to serve static files. It works like
+    :class:`werkzeug.wsgi.SharedDataMiddleware`, but precompressed siblings of files
+    (``.br`` and ``.gz``) are served directly when client accepts their encoding.
+    """
+
+    encodings = ('br', 'gzip')
+    suffixes = {'br': '.br', 'gzip': '.gz'}
+    fallback_mimetype = 'text/plain'
+
+    def __init__(self, app, exports, **kwargs):
+        """
+        :param app: WSGI application to wrap.
+        :param exports: Dict of exported paths. Same as :class:`werkzeug.wsgi.SharedDataMiddleware`.
+        :param kwargs: Extra parameters for :class:`werkzeug.wsgi.SharedDataMiddleware`.
+        """
+        try:
+            from werkzeug.middleware.shared_data import SharedDataMiddleware
+        except ImportError:  # pragma: no cover
+            from werkzeug.wsgi import SharedDataMiddleware
+
+        self.app = app
+        self.shared_data = SharedDataMiddleware(self._not_found, exports, **kwargs)
+
+    @staticmethod
+    def _not_found(environ, start_response):
+        environ['aiowerkzeug.static_not_found'] = True
+        return []
+
+    def _serve(self, environ, start_response, path_info):
+        environ = dict(environ, PATH_INFO=path_info)
+        result = self.shared_data(environ, start_response)
+        if environ.get('aiowerkzeug.static_not_found'):
+            return None
+        return result
+
+    def __call__(self, environ, start_response):
+        path_info = environ.get('PATH_INFO', '')
+
+        if environ['REQUEST_METHOD'] in ('GET', 'HEAD'):
+            for encoding in self.encodings:
+                if not select_encoding(environ, (encoding,)):
+                    continue
+
+                def encoded_start_response(status, headers, exc_info=None, encoding=encoding):
+                    mimetype = mimetypes.guess_type(path_info)[0] or self.fallback_mimetype
+                    headers = [(name, value) for name, value in headers if name.lower() != 'content-type']
+                    headers.extend((('Content-Type', mimetype),
+                                    ('Content-Encoding', encoding),
+                                    ('Vary', 'Accept-Encoding')))
+                    return start_response(status, headers, exc_info)
+
+                result = self._serve(environ, encoded_start_response, path_info + self.suffixes[encoding])
+                if result is not None:
+                    return result
+
+        result = self._serve(environ, start_response, path_info)
+        if result is not None:
+            return result
+        return self.app(environ, start_response)
+
+
+def parse_cache_control(value):
+    """
+    Parses a ``Cache-Control`` header value.
+
+    :return: Dict of directives. Directives without argument have ``None`` value.
+    """
+    directives = {}
+    for item in value.split(','):
+        name, _, arg = item.strip().partition('=')
+        if name:
+            directives[name.lower()] = arg.strip('"') if arg else None
+    return directives
+
+
+class CachedResponse:
+    """
+    Response stored by :class:`~CacheMiddleware`.
+    """
+
+    def __init__(self, status, headers, body=b'', vary=(), vary_values=(), created=None,
+                 expires=None, stale_until=None, storable=False):
+        self.status = status
+        self.headers = headers
+        self.vary = vary
+        self.vary_values = vary_values
+        self.created = created
+        self.expires = expires
+        self.stale_until = stale_until
+        self.storable = storable
+        self.set_body(body)
+
+    def set_body(self, body):
+        self.body = body
+        self.size = len(body) + sum(len(name) + len(value) for name, value in self.headers) + 200
+
+    def matches(self, environ):
+        """
+        Returns whether response could be used for request.
+        """
+        return self.storable and tuple(environ.get(key) for key in self.vary) == self.vary_values
+
+
+class CacheStore:
+    """
+    Memory bounded LRU store of :class:`~CachedResponse` objects. Each key could
+    store several variants of a response, selected by ``Vary`` headers.
+    """
+
+    def __init__(self, max_size=64 * 1024 * 1024):
+        """
+        :param max_size: Maximum size of stored responses, in bytes.
+        """
+        self.max_size = max_size
+        self.size = 0
+        self._entries = OrderedDict()
+
+    def get(self, key, environ, now):
+        """
+        Returns a response for request which is not expired beyond its stale window,
+        or ``None``.
+        """
+        try:
+            variants = self._entries[key]
+        except KeyError:
+            return None
+
+        self._entries.move_to_end(key)
+        for response in variants:
+            if response.matches(environ):
+                if now < response.stale_until:
+                    return response
+                self._remove(key, response)
+                return None
+        return None
+
+    def set(self, key, response):
+        if response.size > self.max_size:
+            return
+
+        variants = self._entries.setdefault(key, [])
+        for old in variants:
+            if old.vary == response.vary and old.vary_values == response.vary_values:
+                self._remove(key, old)
+                variants = self._entries.setdefault(key, [])
+                break
+        variants.append(response)
+        self._entries.move_to_end(key)
+        self.size += response.size
+
+        while self.size > self.max_size:
+            old_key, old_variants = next(iter(self._entries.items()))
+            self._remove(old_key, old_variants[0])
+
+    def _remove(self, key, response):
+        variants = self._entries[key]
+        variants.remove(response)
+        self.size -= response.size
+        if not variants:
+            del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+
+class CacheRecorder:
+    """
+    Response iterable used by :class:`~CacheMiddleware`. It records response of
+    application while it is streamed to client. Storability is decided when application
+    calls ``start_response``: if response could not be stored, requests waiting for it
+    are released immediately and body is not recorded.
+    """
+
+    def __init__(self, middleware, key, environ, start_response, loop):
+        self.middleware = middleware
+        self.key = key
+        self.environ = environ
+        self.result = None
+        self.response = None
+        self.chunks = []
+        self.inflight = loop.create_future()
+        self._start_response = start_response
+
+    def start_response(self, status, headers, exc_info=None):
+        response = None
+        if exc_info is None:
+            response = self.middleware.make_response(self.environ, status, headers)
+
+        if response is not None and response.storable:
+            self.response = response
+        else:
+            self.response = None
+            self.release(None)
+
+        write = self._start_response(status, headers, exc_info)
+
+        def recording_write(data):
+            self.collect(data)
+            write(data)
+
+        return recording_write
+
+    def collect(self, data):
+        if self.response is not None:
+            self.chunks.append(data)
+
+    def __iter__(self):
+        # It is iterated by server on request task.
+        for data in self.result:
+            yield data
+            if isinstance(data, asyncio.Future):
+                # Server awaits futures before it asks for next chunk.
+                if not data.done() or data.cancelled() or data.exception() is not None:
+                    self.response = None
+                    self.release(None)
+                    continue
+                data = data.result()
+            self.collect(data)
+
+        if self.response is not None:
+            self.response.set_body(b''.join(self.chunks))
+            self.middleware.store.set(self.key, self.response)
+        self.release(self.response)
+
+    def close(self):
+        if hasattr(self.result, 'close'):
+            self.result.close()
+        # Waiting requests must run application when response was not completed.
+        self.release(None)
+
+    def release(self, response):
+        if self.middleware.inflight.get(self.key) is self.inflight:
+            del self.middleware.inflight[self.key]
+        if not self.inflight.done():
+            self.inflight.set_result(response)
+
+
+class CacheMiddleware:
+    """
+    WSGI middleware which caches responses in memory.
+
+    Responses are cached by method, scheme, host, path, query string and ``Vary``
+    headers, following ``Cache-Control`` directives. Responses are streamed to client
+    while they are recorded. Concurrent misses for same key are coalesced, so only one
+    request runs application while others wait for its response; they are released
+    as soon as response is known to be not storable. Stale responses inside
+    ``stale-while-revalidate`` window are served while they are refreshed on a
+    background task.
+
+    Waiting requests yield futures, so it must be served by
+    :class:`~aiowerkzeug.serving.WSGIServerProtocol`.
+    """
+
+    cacheable_methods = ('GET', 'HEAD')
+    cacheable_status = ('200', '203', '300', '301', '404', '410')
+
+    def __init__(self, app, max_size=64 * 1024 * 1024, default_ttl=0, loop=None):
+        """
+        :param app: WSGI application to wrap.
+        :param max_size: Maximum size of stored responses, in bytes.
+        :param default_ttl: Time to live for responses without freshness directives, in seconds.
+        :param loop: Event loop.
+        """
+        self.app = app
+        self.store = CacheStore(max_size)
+        self.default_ttl = default_ttl
+        self.loop = loop
+        self.inflight = {}
+        self.revalidating = set()
+
+    def make_key(self, environ):
+        return (environ['REQUEST_METHOD'], environ.get('wsgi.url_scheme', ''), environ.get('HTTP_HOST', ''),
+                environ.get('PATH_INFO', ''), environ.get('QUERY_STRING', ''))
+
+    def __call__(self, environ, start_response):
+        if environ['REQUEST_METHOD'] not in self.cacheable_methods or 'HTTP_AUTHORIZATION' in environ:
+            return self.app(environ, start_response)
+
+        request_cc = parse_cache_control(environ.get('HTTP_CACHE_CONTROL', ''))
+        if 'no-store' in request_cc:
+            return self.app(environ, start_response)
+
+        key = self.make_key(environ)
+        now = time.monotonic()
+
+        if 'no-cache' not in request_cc:
+            response = self.store.get(key, environ, now)
+            if response is not None:
+                if now >= response.expires and key not in self.revalidating:
+                    self.revalidate(key, environ)
+                return self.serve(response, start_response, now)
+
+        try:
+            inflight = self.inflight[key]
+        except KeyError:
+            return self.fetch(key, environ, start_response)
+        return self.wait_response(key, inflight, environ, start_response)
+
+    def serve(self, response, start_response, now):
+        headers = response.headers + [('Age', str(int(now - response.created)))]
+        start_response(response.status, headers)
+        return [response.body]
+
+    def fetch(self, key, environ, start_response):
+        """
+        Runs application for a request. Its response is recorded while it is served,
+        and it is stored when it is cacheable.
+
+        :return: :class:`~CacheRecorder`
+        """
+        loop = self.loop or asyncio.get_event_loop()
+        recorder = CacheRecorder(self, key, environ, start_response, loop)
+        self.inflight[key] = recorder.inflight
+        try:
+            recorder.result = self.app(environ, recorder.start_response)
+        except Exception:
+            recorder.release(None)
+            raise
+        return recorder
+
+    def make_response(self, environ, status, headers):
+        """
+        Returns a :class:`~CachedResponse` without body. It is storable when
+        status and headers allow it.
+        """
+        now = time.monotonic()
+        response = CachedResponse(status, headers, created=now)
+        if status[:3] not in self.cacheable_status:
+            return response
+
+        cache_control = {}
+        vary = ()
+        for name, value in headers:
+            name = name.lower()
+            if name == 'cache-control':
+                cache_control.update(parse_cache_control(value))
+            elif name == 'vary':
+                vary += tuple(v.strip() for v in value.split(',') if v.strip())
+            elif name == 'set-cookie':
+                return response
+
+        if '*' in vary or {'no-store', 'no-cache', 'private'} & set(cache_control):
+            return response
+
+        try:
+            ttl = int(cache_control.get('s-maxage') or cache_control.get('max-age') or self.default_ttl)
+            stale = int(cache_control.get('stale-while-revalidate') or 0)
+        except ValueError:
+            return response
+        if ttl <= 0:
+            return response
+
+        response.vary = tuple(self._get_environ_key(name) for name in vary)
+        response.vary_values = tuple(environ.get(key) for key in response.vary)
+        response.expires = now + ttl
+        response.stale_until = response.expires + stale
+        response.storable = True
+        return response
+
+    @staticmethod
+    def _get_environ_key(name):
+        key = name.upper().replace('-', '_')
+        if key in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            return key
+        return 'HTTP_' + key
+
+    def wait_response(self, key, inflight, environ, start_response):
+        """
+        Waits for response of other request for same key. It is a generator, so
+        application runs on request task when response could not be shared.
+        """
+        if not inflight.done():
+            loop = self.loop or asyncio.get_event_loop()
+            ready = loop.create_future()
+
+            def set_ready(fut):
+                if not ready.done():
+                    ready.set_result(b'')
+
+            inflight.add_done_callback(set_ready)
+            yield ready
+
+        response = inflight.result()
+        if response is not None and response.matches(environ):
+            yield from self.serve(response, start_response, time.monotonic())
+            return
+
+        # Response of other request could not be shared, so application must run again.
+        result = self.fetch(key, environ, start_response)
+        try:
+            yield from result
+        finally:
+            result.close()
+
+    def revalidate(self, key, environ):
+        self.revalidating.add(key)
+        environ = dict(environ)
+        environ['wsgi.input'] = BytesIO()
+        loop = self.loop or asyncio.get_event_loop()
+        asyncio.ensure_future(self._revalidate(key, environ), loop=loop)
+
+    @staticmethod
+    def _ignore_response(status, headers, exc_info=None):
+        return lambda data: None
+
+    async def _revalidate(self, key, environ):
+        # Application runs and its response is consumed on this task.
+        try:
+            result = self.fetch(key, environ, self._ignore_response)
+            try:
+                for data in result:
+                    if isinstance(data, asyncio.Future):
+                        await data
+            finally:
+                result.close()
+        except Exception:
+            _log('error', 'Error revalidating cached response:\n%s', traceback.format_exc())
+        finally:
+            self.revalidating.discard(key)
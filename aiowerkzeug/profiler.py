@@ -0,0 +1,222 @@
+"""
+profiler.py
+
+Sampling profiler for applications served by :func:`aiowerkzeug.serving.run_simple`.
+
+Event loop thread stack is sampled from a background thread. Samples are attributed
+to request running on current task, and samples spent entering or exiting contexts of
+:func:`~aiowerkzeug.local.context_coroutine` or :func:`~aiowerkzeug.local.keep_context_factory`
+are counted separately. Collected stacks are dumped in collapsed format, ready to be
+used by flamegraph tools.
+"""
+import asyncio
+import os
+import signal
+import sys
+import tempfile
+import threading
+from collections import Counter
+from urllib.parse import parse_qs
+from ._internal import _log
+
+__author__ = 'alfred'
+
+
+NO_REQUEST = '<no request>'
+CONTEXT_CALLERS = ('send', '__next__', 'wrapper')
+CONTEXT_METHODS = ('__enter__', '__exit__')
+
+
+try:
+    _current_task = asyncio.current_task
+except AttributeError:  # pragma: no cover
+    _current_task = asyncio.Task.current_task
+
+
+class SamplingProfiler:
+    """
+    Sampling profiler of event loop thread.
+    """
+
+    def __init__(self, interval=0.005, max_depth=64, dump_path=None, dump_signal=signal.SIGUSR1,
+                 admin_path=None):
+        """
+        :param interval: Interval between samples, in seconds.
+        :param max_depth: Maximum stack depth to sample.
+        :param dump_path: File where collapsed stacks are dumped when ``dump_signal`` is received.
+                          Default is ``aiowerkzeug-<pid>.folded`` on temporary directory.
+        :param dump_signal: Signal to dump collapsed stacks. ``None`` disables it.
+        :param admin_path: Path of admin endpoint served by :class:`~ProfilerMiddleware`.
+                           ``None`` disables it.
+        """
+        from . import local
+
+        self.interval = interval
+        self.max_depth = max_depth
+        self.dump_path = dump_path or os.path.join(tempfile.gettempdir(), 'aiowerkzeug-%d.folded' % os.getpid())
+        self.dump_signal = dump_signal
+        self.admin_path = admin_path
+        self.request_local = local.AsyncLocal()
+
+        self.loop = None
+        self.thread_id = None
+        self.samples = Counter()
+        self.route_samples = Counter()
+        self.context_samples = Counter()
+        self._labels = {}
+        self._local_file = local.__file__
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, loop=None):
+        """
+        Starts sampling. It must be called from event loop thread.
+        """
+        self.loop = loop or asyncio.get_event_loop()
+        self.thread_id = threading.get_ident()
+        if self.dump_signal is not None:
+            self.loop.add_signal_handler(self.dump_signal, self.dump)
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='aiowerkzeug-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.dump_signal is not None and self.loop is not None:
+            self.loop.remove_signal_handler(self.dump_signal)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.sample(frame)
+            # Frame must not be kept alive until next sample.
+            del frame
+
+    def get_route(self):
+        task = _current_task(loop=self.loop)
+        if task is None:
+            return NO_REQUEST
+        return self.request_local.__storage__.get(id(task), {}).get('route', NO_REQUEST)
+
+    def _get_label(self, code):
+        try:
+            return self._labels[code]
+        except KeyError:
+            label = '%s (%s:%d)' % (code.co_name, code.co_filename, code.co_firstlineno)
+            self._labels[code] = label
+            return label
+
+    def sample(self, frame):
+        """
+        Takes a sample of a stack.
+
+        :param frame: Top frame of stack.
+        """
+        route = self.get_route()
+        stack = []
+        in_context = False
+        child = None
+        while frame is not None and len(stack) < self.max_depth:
+            code = frame.f_code
+            if child is not None and child.co_name in CONTEXT_METHODS \
+                    and code.co_name in CONTEXT_CALLERS and code.co_filename == self._local_file:
+                in_context = True
+            stack.append(self._get_label(code))
+            child = code
+            frame = frame.f_back
+
+        stack.append(route)
+        stack.reverse()
+        key = ';'.join(stack)
+
+        with self._lock:
+            self.samples[key] += 1
+            self.route_samples[route] += 1
+            if in_context:
+                self.context_samples[route] += 1
+
+    def reset(self):
+        with self._lock:
+            self.samples.clear()
+            self.route_samples.clear()
+            self.context_samples.clear()
+
+    def format_collapsed(self):
+        """
+        Returns samples in collapsed stack format: one line per stack, with frames
+        separated by semicolons followed by number of samples. First frame is route.
+        """
+        with self._lock:
+            samples = list(self.samples.items())
+        return ''.join('%s %d\n' % (stack, count) for stack, count in sorted(samples))
+
+    def format_report(self):
+        """
+        Returns a summary of samples by route, including samples spent entering or
+        exiting contexts.
+        """
+        with self._lock:
+            routes = self.route_samples.most_common()
+            context = dict(self.context_samples)
+
+        total = sum(count for _, count in routes) or 1
+        lines = ['%8s %7s %8s  %s\n' % ('samples', 'total', 'context', 'route')]
+        for route, count in routes:
+            lines.append('%8d %6.1f%% %7.1f%%  %s\n' % (count, count * 100 / total,
+                                                        context.get(route, 0) * 100 / count, route))
+        return ''.join(lines)
+
+    def dump(self):
+        """
+        Writes collapsed stacks to ``dump_path`` and logs report.
+        """
+        with open(self.dump_path, 'w') as f:
+            f.write(self.format_collapsed())
+        _log('info', ' * Profile dumped to %s\n%s', self.dump_path, self.format_report())
+
+
+class ProfilerMiddleware:
+    """
+    WSGI middleware which sets route of request for :class:`~SamplingProfiler`, and it
+    serves profiler admin endpoint. Admin endpoint returns collapsed stacks, or report
+    using ``?format=report``. Samples are reset using ``?reset=1``.
+    """
+
+    def __init__(self, app, profiler):
+        self.app = app
+        self.profiler = profiler
+
+    def __call__(self, environ, start_response):
+        if self.profiler.admin_path is not None and environ.get('PATH_INFO') == self.profiler.admin_path:
+            return self.serve_admin(environ, start_response)
+
+        from werkzeug.wsgi import ClosingIterator
+
+        self.profiler.request_local.route = '%s %s' % (environ['REQUEST_METHOD'], environ.get('PATH_INFO', ''))
+        try:
+            result = self.app(environ, start_response)
+        except BaseException:
+            self.profiler.request_local.__release_local__()
+            raise
+        return ClosingIterator(result, self.profiler.request_local.__release_local__)
+
+    def serve_admin(self, environ, start_response):
+        query = parse_qs(environ.get('QUERY_STRING', ''))
+        if query.get('format') == ['report']:
+            body = self.profiler.format_report()
+        else:
+            body = self.profiler.format_collapsed()
+        if query.get('reset') == ['1']:
+            self.profiler.reset()
+
+        body = body.encode('utf-8')
+        start_response('200 OK', [('Content-Type', 'text/plain; charset=utf-8'),
+                                  ('Content-Length', str(len(body))),
+                                  ('Cache-Control', 'no-store')])
+        return [body]
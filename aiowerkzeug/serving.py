@@ -1,24 +1,984 @@
 import asyncio
 import socket
 import os
+import stat
 import sys
-from aiohttp.wsgi import WSGIServerHttpProtocol
-from werkzeug._internal import _log
-from werkzeug.serving import select_ip_version
+import time
+import traceback
+from collections import deque
+from io import BytesIO
+from urllib.parse import unquote_to_bytes
+from ._internal import _log
+
+try:
+    import httptools
+except ImportError:  # pragma: no cover
+    httptools = None
 
 __author__ = 'alfred'
 
 
+SERVER_SOFTWARE = 'aiowerkzeug'
+
+
+class HttpParserError(Exception):
+    """
+    Error raised when a request could not be parsed.
+    """
+
+
+class PyHttpRequestParser:
+    """
+    Pure python HTTP/1.x request parser.
+
+    It implements same interface as :class:`httptools.HttpRequestParser`, so it is used
+    when httptools is not installed. It calls protocol callbacks ``on_message_begin``,
+    ``on_url``, ``on_header``, ``on_headers_complete``, ``on_body`` and
+    ``on_message_complete``.
+    """
+
+    max_line_size = 8190
+    max_headers = 100
+
+    def __init__(self, protocol):
+        self.protocol = protocol
+        self._buffer = bytearray()
+        self._state = self._parse_request_line
+        self._method = None
+        self._version = None
+        self._keep_alive = False
+        self._connection = None
+        self._content_length = None
+        self._chunked = False
+        self._headers_count = 0
+        self._remaining = 0
+
+    def get_method(self):
+        return self._method
+
+    def get_http_version(self):
+        return self._version
+
+    def should_keep_alive(self):
+        return self._keep_alive
+
+    def feed_data(self, data):
+        self._buffer += data
+        while self._state():
+            pass
+
+    def _read_line(self):
+        idx = self._buffer.find(b'\r\n')
+        if idx < 0:
+            if len(self._buffer) > self.max_line_size:
+                raise HttpParserError('Line too long')
+            return None
+        line = bytes(self._buffer[:idx])
+        del self._buffer[:idx + 2]
+        return line
+
+    def _parse_request_line(self):
+        line = self._read_line()
+        if line is None:
+            return False
+        if not line:
+            # Empty lines between pipelined requests must be ignored.
+            return True
+
+        try:
+            method, url, version = line.split(b' ')
+        except ValueError:
+            raise HttpParserError('Invalid request line')
+        if not version.startswith(b'HTTP/1.'):
+            raise HttpParserError('Unsupported HTTP version')
+
+        self._method = method
+        self._version = version[5:].decode('ascii')
+        self._connection = None
+        self._content_length = None
+        self._chunked = False
+        self._headers_count = 0
+
+        self.protocol.on_message_begin()
+        self.protocol.on_url(url)
+        self._state = self._parse_header
+        return True
+
+    def _parse_header(self):
+        line = self._read_line()
+        if line is None:
+            return False
+        if not line:
+            return self._headers_complete()
+
+        name, sep, value = line.partition(b':')
+        if not sep or not name or name != name.strip():
+            raise HttpParserError('Invalid header')
+        self._headers_count += 1
+        if self._headers_count > self.max_headers:
+            raise HttpParserError('Too many headers')
+
+        value = value.strip()
+        lname = name.lower()
+        if lname == b'content-length':
+            try:
+                self._content_length = int(value)
+            except ValueError:
+                raise HttpParserError('Invalid content length')
+            if self._content_length < 0:
+                raise HttpParserError('Invalid content length')
+        elif lname == b'transfer-encoding':
+            self._chunked = value.lower().endswith(b'chunked')
+        elif lname == b'connection':
+            self._connection = value.lower()
+
+        self.protocol.on_header(name, value)
+        return True
+
+    def _headers_complete(self):
+        if self._chunked and self._content_length is not None:
+            # Length is ambiguous, it could be used to smuggle requests behind a proxy.
+            raise HttpParserError('Content-Length with chunked Transfer-Encoding')
+
+        if self._version == '1.0':
+            self._keep_alive = self._connection == b'keep-alive'
+        else:
+            self._keep_alive = self._connection != b'close'
+
+        self.protocol.on_headers_complete()
+
+        if self._chunked:
+            self._state = self._parse_chunk_size
+        elif self._content_length:
+            self._remaining = self._content_length
+            self._state = self._parse_body
+        else:
+            self._message_complete()
+        return True
+
+    def _parse_body(self):
+        if not self._buffer:
+            return False
+        chunk = bytes(self._buffer[:self._remaining])
+        del self._buffer[:len(chunk)]
+        self._remaining -= len(chunk)
+        self.protocol.on_body(chunk)
+        if not self._remaining:
+            if self._chunked:
+                self._state = self._parse_chunk_end
+            else:
+                self._message_complete()
+        return True
+
+    def _parse_chunk_size(self):
+        line = self._read_line()
+        if line is None:
+            return False
+        try:
+            size = int(line.split(b';', 1)[0], 16)
+        except ValueError:
+            raise HttpParserError('Invalid chunk size')
+        if size < 0:
+            raise HttpParserError('Invalid chunk size')
+
+        if size:
+            self._remaining = size
+            self._state = self._parse_body
+        else:
+            self._state = self._parse_trailer
+        return True
+
+    def _parse_chunk_end(self):
+        line = self._read_line()
+        if line is None:
+            return False
+        if line:
+            raise HttpParserError('Invalid chunk end')
+        self._state = self._parse_chunk_size
+        return True
+
+    def _parse_trailer(self):
+        line = self._read_line()
+        if line is None:
+            return False
+        if not line:
+            self._message_complete()
+        return True
+
+    def _message_complete(self):
+        self._state = self._parse_request_line
+        self.protocol.on_message_complete()
+
+
+if httptools is not None:
+    HttpRequestParser = httptools.HttpRequestParser
+    PARSER_ERRORS = (HttpParserError, httptools.HttpParserError)
+    UPGRADE_ERRORS = (httptools.HttpParserUpgrade,)
+else:  # pragma: no cover
+    HttpRequestParser = PyHttpRequestParser
+    PARSER_ERRORS = (HttpParserError,)
+    UPGRADE_ERRORS = ()
+
+
+_environ_keys = {}
+
+
+def _get_environ_key(name):
+    """
+    Returns WSGI environ key for a raw header name. Keys are cached in order to
+    avoid to build them on every request.
+    """
+    try:
+        return _environ_keys[name]
+    except KeyError:
+        pass
+
+    key = name.decode('latin-1').upper().replace('-', '_')
+    if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+        key = 'HTTP_' + key
+    if len(_environ_keys) < 1024:
+        _environ_keys[name] = key
+    return key
+
+
+_date_header = [0, '']
+_weekdays = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+_months = (None, 'Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+def _get_date_header():
+    now = int(time.time())
+    if _date_header[0] != now:
+        t = time.gmtime(now)
+        _date_header[0] = now
+        _date_header[1] = 'Date: %s, %02d %s %04d %02d:%02d:%02d GMT\r\n' % (
+            _weekdays[t.tm_wday], t.tm_mday, _months[t.tm_mon], t.tm_year, t.tm_hour, t.tm_min, t.tm_sec)
+    return _date_header[1]
+
+
+class WSGIResponse:
+    """
+    Response of a WSGI application for a request. It implements ``start_response``
+    and ``write`` callables.
+    """
+
+    def __init__(self, transport, environ, keep_alive=True):
+        self.transport = transport
+        self.environ = environ
+        self.keep_alive = keep_alive
+        self.status = None
+        self.headers = None
+        self.headers_sent = False
+        self.chunked = False
+        self.with_body = environ['REQUEST_METHOD'] != 'HEAD'
+        self.length = 0
+
+    def start_response(self, status, headers, exc_info=None):
+        if exc_info:
+            try:
+                if self.headers_sent:
+                    raise exc_info[1].with_traceback(exc_info[2])
+            finally:
+                exc_info = None
+        elif self.status is not None:
+            raise AssertionError('Headers already set')
+
+        self.status = status
+        self.headers = headers
+        return self.write
+
+    def send_headers(self):
+        if self.status is None:
+            raise AssertionError('write() before start_response()')
+
+        has_length = has_date = has_server = False
+        code = self.status[:3]
+        lines = ['HTTP/1.1 ', self.status, '\r\n']
+        for name, value in self.headers:
+            lname = name.lower()
+            if lname in ('content-length', 'transfer-encoding'):
+                has_length = True
+            elif lname == 'connection' and value.lower() == 'close':
+                self.keep_alive = False
+            elif lname == 'date':
+                has_date = True
+            elif lname == 'server':
+                has_server = True
+            lines.extend((name, ': ', value, '\r\n'))
+
+        if not has_date:
+            lines.append(_get_date_header())
+        if not has_server:
+            lines.extend(('Server: ', SERVER_SOFTWARE, '\r\n'))
+
+        if code in ('204', '304') or code.startswith('1'):
+            self.with_body = False
+        elif not has_length and self.with_body:
+            if self.environ['SERVER_PROTOCOL'] == 'HTTP/1.1':
+                self.chunked = True
+                lines.append('Transfer-Encoding: chunked\r\n')
+            else:
+                self.keep_alive = False
+
+        if not self.keep_alive:
+            lines.append('Connection: close\r\n')
+        elif self.environ['SERVER_PROTOCOL'] == 'HTTP/1.0':
+            lines.append('Connection: keep-alive\r\n')
+        lines.append('\r\n')
+
+        self.headers_sent = True
+        self.transport.write(''.join(lines).encode('latin-1'))
+
+    def write(self, data):
+        # Headers are not sent until first non-empty data (PEP 3333).
+        if not data:
+            return
+        if not self.headers_sent:
+            self.send_headers()
+        if not self.with_body:
+            return
+
+        self.length += len(data)
+        if self.chunked:
+            self.transport.writelines((b'%x\r\n' % len(data), data, b'\r\n'))
+        else:
+            self.transport.write(data)
+
+    def finish(self):
+        if not self.headers_sent:
+            self.send_headers()
+        if self.chunked:
+            self.transport.write(b'0\r\n\r\n')
+
+
+class HandshakeMetrics:
+    """
+    TLS handshake metrics. Handshake time is measured from connection is accepted until
+    handshake finishes, so it includes network round trips.
+    """
+
+    def __init__(self):
+        self.full_handshakes = 0
+        self.full_time = 0.0
+        self.resumed_handshakes = 0
+        self.resumed_time = 0.0
+
+    def record(self, duration, resumed):
+        if resumed:
+            self.resumed_handshakes += 1
+            self.resumed_time += duration
+        else:
+            self.full_handshakes += 1
+            self.full_time += duration
+
+    def as_dict(self):
+        total = self.full_handshakes + self.resumed_handshakes
+        return {'full_handshakes': self.full_handshakes,
+                'full_avg_time': self.full_time / self.full_handshakes if self.full_handshakes else 0.0,
+                'resumed_handshakes': self.resumed_handshakes,
+                'resumed_avg_time': self.resumed_time / self.resumed_handshakes if self.resumed_handshakes else 0.0,
+                'resumed_ratio': self.resumed_handshakes / total if total else 0.0}
+
+
+def _make_adhoc_cert_files():
+    import atexit
+    import shutil
+    import tempfile
+    from werkzeug.serving import make_ssl_devcert
+
+    path = tempfile.mkdtemp()
+    atexit.register(shutil.rmtree, path, True)
+    return make_ssl_devcert(os.path.join(path, 'adhoc'), host='localhost')
+
+
+def load_ssl_context(ssl_context, alpn_protocols=('http/1.1',), num_tickets=2):
+    """
+    Returns a server :class:`ssl.SSLContext` to be used by asyncio server.
+
+    Contexts built from certificate files have session tickets enabled, so returning
+    clients could resume sessions without a full handshake, and they negotiate
+    ``alpn_protocols``. :class:`ssl.SSLContext` objects are returned as they are.
+
+    :param ssl_context: Either an :class:`ssl.SSLContext`, a tuple in the form
+                        ``(cert_file, pkey_file)`` or the string ``'adhoc'``.
+    :param alpn_protocols: ALPN protocols to negotiate.
+    :param num_tickets: Number of TLS 1.3 session tickets sent to clients.
+    :return: ssl.SSLContext
+    """
+    import ssl
+
+    if isinstance(ssl_context, ssl.SSLContext):
+        return ssl_context
+
+    if ssl_context == 'adhoc':
+        ssl_context = _make_adhoc_cert_files()
+    if not isinstance(ssl_context, tuple):
+        raise TypeError("SSL context must be an ssl.SSLContext, a tuple (cert_file, pkey_file) or 'adhoc'")
+
+    cert_file, pkey_file = ssl_context
+    ctx = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    ctx.load_cert_chain(cert_file, pkey_file)
+
+    ctx.options &= ~ssl.OP_NO_TICKET
+    if hasattr(ctx, 'num_tickets'):
+        ctx.num_tickets = num_tickets
+    if alpn_protocols and ssl.HAS_ALPN:
+        ctx.set_alpn_protocols(list(alpn_protocols))
+    return ctx
+
+
+SD_LISTEN_FDS_START = 3
+
+
+def get_unix_socket_path(host):
+    """
+    Returns path of a unix socket host, in the form ``unix:/path`` or ``unix:///path``.
+    It returns ``None`` for other hosts.
+    """
+    if not host or not host.startswith('unix:'):
+        return None
+    path = host[5:]
+    if path.startswith('//'):
+        path = path[2:]
+    return path
+
+
+def bind_unix_socket(path, mode=None):
+    """
+    Returns a unix stream socket bound to ``path``. Stale socket files are removed.
+
+    :param path: Socket file path.
+    :param mode: File permissions of socket, for example ``0o660``. ``None`` means
+                 permissions set by umask.
+    :return: socket.socket
+    """
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.remove(path)
+    except FileNotFoundError:
+        pass
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = None
+    if mode is not None:
+        # Socket file is created with right permissions, so there is no window to connect.
+        old_umask = os.umask(~mode & 0o777)
+    try:
+        sock.bind(path)
+    except OSError:
+        sock.close()
+        raise
+    finally:
+        if old_umask is not None:
+            os.umask(old_umask)
+    return sock
+
+
+def get_systemd_sockets(unset_environment=True):
+    """
+    Returns sockets passed by systemd socket activation (``LISTEN_FDS`` protocol).
+
+    :param unset_environment: Remove socket activation variables from environment, so
+                              child processes do not try to use them.
+    :return: List of sockets. It is empty when process was not socket activated.
+    """
+    try:
+        if int(os.environ.get('LISTEN_PID', '')) != os.getpid():
+            return []
+        count = int(os.environ.get('LISTEN_FDS', ''))
+    except ValueError:
+        return []
+    finally:
+        if unset_environment:
+            for name in ('LISTEN_PID', 'LISTEN_FDS', 'LISTEN_FDNAMES'):
+                os.environ.pop(name, None)
+
+    sockets = []
+    for fd in range(SD_LISTEN_FDS_START, SD_LISTEN_FDS_START + count):
+        sock = socket.socket(fileno=fd)
+        sock.set_inheritable(False)
+        sockets.append(sock)
+    return sockets
+
+
+class AdmissionController:
+    """
+    Admission control for servers under overload.
+
+    Requests arriving while too many requests are pending or while event loop lags
+    too much get a fast ``503`` response with ``Retry-After`` header. Requests which
+    waited too long on queue, or whose client deadline has already passed, are
+    dropped before application is called. Same controller must be shared by all
+    connections of a server.
+    """
+
+    def __init__(self, max_pending=1000, max_lag=0.5, max_queue_time=None,
+                 deadline_header='X-Request-Deadline', retry_after=1, lag_interval=0.1):
+        """
+        :param max_pending: Maximum number of pending requests.
+        :param max_lag: Maximum event loop lag, in seconds.
+        :param max_queue_time: Maximum time a request could wait before application is called,
+                               in seconds. ``None`` means no limit.
+        :param deadline_header: Request header with client deadline as a unix timestamp.
+                                ``None`` disables deadlines.
+        :param retry_after: Value of ``Retry-After`` header, in seconds.
+        :param lag_interval: Interval between event loop lag measures, in seconds.
+        """
+        self.max_pending = max_pending
+        self.max_lag = max_lag
+        self.max_queue_time = max_queue_time
+        self.deadline_key = None
+        if deadline_header:
+            self.deadline_key = 'HTTP_' + deadline_header.upper().replace('-', '_')
+        self.retry_after = str(retry_after)
+        self.lag_interval = lag_interval
+
+        self.loop = None
+        self.pending = 0
+        self.lag = 0.0
+        self.rejected = 0
+        self.dropped = 0
+        self._expected = None
+        self._handle = None
+
+    def start(self, loop):
+        """
+        Starts event loop lag monitor.
+        """
+        self.loop = loop
+        if self._handle is None:
+            self._expected = loop.time() + self.lag_interval
+            self._handle = loop.call_later(self.lag_interval, self._measure_lag)
+
+    def stop(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _measure_lag(self):
+        now = self.loop.time()
+        self.lag = max(0.0, now - self._expected)
+        self._expected = now + self.lag_interval
+        self._handle = self.loop.call_later(self.lag_interval, self._measure_lag)
+
+    def is_overloaded(self):
+        return self.pending >= self.max_pending or self.lag >= self.max_lag
+
+    def request_arrived(self, environ, now):
+        """
+        Registers a new pending request.
+        """
+        environ['aiowerkzeug.arrival_time'] = now
+        environ['aiowerkzeug.admitted'] = not self.is_overloaded()
+        self.pending += 1
+
+    def request_finished(self, environ):
+        self.pending -= 1
+
+    def deadline_passed(self, environ, now):
+        if self.max_queue_time is not None and now - environ['aiowerkzeug.arrival_time'] > self.max_queue_time:
+            return True
+
+        if self.deadline_key is None or self.deadline_key not in environ:
+            return False
+        try:
+            return float(environ[self.deadline_key]) < time.time()
+        except ValueError:
+            return False
+
+    def select_app(self, environ, app, now):
+        """
+        Returns application to run for a request. It is ``app`` when request is
+        admitted, otherwise it is a rejection application.
+        """
+        if not environ['aiowerkzeug.admitted']:
+            self.rejected += 1
+            return self.reject
+        if self.deadline_passed(environ, now):
+            self.dropped += 1
+            return self.drop
+        return app
+
+    def reject(self, environ, start_response):
+        start_response('503 SERVICE UNAVAILABLE', [('Content-Type', 'text/plain'),
+                                                   ('Content-Length', '0'),
+                                                   ('Retry-After', self.retry_after)])
+        return []
+
+    def drop(self, environ, start_response):
+        start_response('503 SERVICE UNAVAILABLE', [('Content-Type', 'text/plain'),
+                                                   ('Content-Length', '0')])
+        return []
+
+
+class WSGIServerProtocol(asyncio.Protocol):
+    """
+    Asyncio protocol which serves a WSGI application over HTTP/1.1.
+
+    Pipelined requests are parsed as soon as they arrive and they are processed in
+    order. Each request runs on its own task, so async locals are not shared between
+    requests on same connection.
+
+    Response iterables may yield :class:`asyncio.Future` objects, they are awaited and
+    their results are written. It allows middlewares to offload work to executors.
+    Applications could return a coroutine or a future too, they are awaited in order
+    to get response iterable.
+
+    Protocol upgrades are not supported: upgrade requests are answered as plain ones
+    and connection is closed afterwards.
+    """
+
+    parser_class = HttpRequestParser
+    response_class = WSGIResponse
+    max_pipelined_requests = 16
+    keep_alive_timeout = 75
+    max_request_body_size = 16 * 1024 * 1024
+
+    def __init__(self, app, loop=None, url_scheme='http', passthrough_errors=False, handshake_metrics=None,
+                 admission=None):
+        self.app = app
+        self.loop = loop or asyncio.get_event_loop()
+        self.url_scheme = url_scheme
+        self.passthrough_errors = passthrough_errors
+        self.handshake_metrics = handshake_metrics
+        self.admission = admission
+        # Protocol is built when connection is accepted, before TLS handshake.
+        self.accepted_at = self.loop.time()
+        self.transport = None
+        self.parser = None
+        self.base_environ = None
+        self.requests = deque()
+        self.handler = None
+        self.reading_paused = False
+        self.drain_waiter = None
+        self.idle_handle = None
+        self.continue_pending = False
+        self.error_status = None
+        self.half_closed = False
+
+        self._url = None
+        self._headers = None
+        self._body = None
+        self._body_size = 0
+        self._environ = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        if self.handshake_metrics is not None:
+            ssl_object = transport.get_extra_info('ssl_object')
+            if ssl_object is not None:
+                self.handshake_metrics.record(self.loop.time() - self.accepted_at,
+                                              getattr(ssl_object, 'session_reused', False))
+        self.parser = self.parser_class(self)
+        self.base_environ = self.make_base_environ()
+        self.set_idle()
+
+    def connection_lost(self, exc):
+        self.transport = None
+        self.parser = None
+        if self.admission is not None:
+            for environ, _ in self.requests:
+                if environ is not None:
+                    self.admission.request_finished(environ)
+        self.requests.clear()
+        self.cancel_idle()
+        self.resume_writing()
+
+    def make_base_environ(self):
+        """
+        Builds environ values which are constant for all requests on connection.
+        """
+        server = self.transport.get_extra_info('sockname')
+        peer = self.transport.get_extra_info('peername')
+
+        environ = {'wsgi.version': (1, 0),
+                   'wsgi.url_scheme': self.url_scheme,
+                   'wsgi.errors': sys.stderr,
+                   'wsgi.multithread': False,
+                   'wsgi.multiprocess': False,
+                   'wsgi.run_once': False,
+                   'SERVER_SOFTWARE': SERVER_SOFTWARE,
+                   'SCRIPT_NAME': ''}
+
+        if isinstance(server, tuple):
+            environ['SERVER_NAME'] = server[0]
+            environ['SERVER_PORT'] = str(server[1])
+        else:
+            environ['SERVER_NAME'] = server or ''
+            environ['SERVER_PORT'] = ''
+
+        if isinstance(peer, tuple):
+            environ['REMOTE_ADDR'] = peer[0]
+            environ['REMOTE_PORT'] = str(peer[1])
+        else:
+            environ['REMOTE_ADDR'] = peer or ''
+            environ['REMOTE_PORT'] = ''
+
+        return environ
+
+    def set_idle(self):
+        self.cancel_idle()
+        if self.keep_alive_timeout:
+            self.idle_handle = self.loop.call_later(self.keep_alive_timeout, self.close)
+
+    def cancel_idle(self):
+        if self.idle_handle is not None:
+            self.idle_handle.cancel()
+            self.idle_handle = None
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+
+    def data_received(self, data):
+        if self.parser is None:
+            return
+
+        self.cancel_idle()
+        try:
+            self.parser.feed_data(data)
+        except PARSER_ERRORS:
+            # Error response must be sent after previous pipelined ones.
+            self.parser = None
+            self.transport.pause_reading()
+            if self.error_status is None:
+                self.error_status = b'400 Bad Request'
+            self.enqueue_request(None, False)
+        except UPGRADE_ERRORS:
+            # Data after upgrade request does not belong to HTTP/1.1, so parsing stops.
+            self.parser = None
+            self.transport.pause_reading()
+            if self._environ is None:
+                environ, _ = self.requests[-1]
+                self.requests[-1] = (environ, False)
+            else:
+                self.error_status = b'400 Bad Request'
+                self.enqueue_request(None, False)
+
+    def eof_received(self):
+        # Client could half-close connection after sending its requests, so transport
+        # is kept open until their responses are written.
+        self.parser = None
+        self.half_closed = True
+        if self.requests:
+            environ, _ = self.requests[-1]
+            self.requests[-1] = (environ, False)
+        return self.handler is not None
+
+    def on_message_begin(self):
+        self._url = b''
+        self._headers = []
+        self._body = []
+        self._body_size = 0
+
+    def on_url(self, url):
+        self._url += url
+
+    def on_header(self, name, value):
+        self._headers.append((name, value))
+
+    def on_headers_complete(self):
+        environ = self.base_environ.copy()
+        environ['REQUEST_METHOD'] = self.parser.get_method().decode('ascii')
+        environ['SERVER_PROTOCOL'] = 'HTTP/' + self.parser.get_http_version()
+        environ['REQUEST_URI'] = environ['RAW_URI'] = self._url.decode('latin-1')
+
+        path, _, query = self._url.partition(b'?')
+        environ['PATH_INFO'] = unquote_to_bytes(path).decode('latin-1')
+        environ['QUERY_STRING'] = query.decode('latin-1')
+
+        for name, value in self._headers:
+            key = _get_environ_key(name)
+            value = value.decode('latin-1')
+            if key in environ:
+                environ[key] += ',' + value
+            else:
+                environ[key] = value
+
+        if self.max_request_body_size is not None:
+            try:
+                content_length = int(environ.get('CONTENT_LENGTH', 0))
+            except ValueError:
+                raise HttpParserError('Invalid content length')
+            if content_length > self.max_request_body_size:
+                self.request_too_large()
+
+        if environ.get('HTTP_EXPECT', '').lower() == '100-continue' \
+                and environ['SERVER_PROTOCOL'] == 'HTTP/1.1':
+            if self.handler is None:
+                self.transport.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+            else:
+                # It must not be written in the middle of previous pipelined responses.
+                self.continue_pending = True
+
+        self._environ = environ
+        self._headers = None
+
+    def on_body(self, body):
+        self._body_size += len(body)
+        if self.max_request_body_size is not None and self._body_size > self.max_request_body_size:
+            self.request_too_large()
+        self._body.append(body)
+
+    def request_too_large(self):
+        self.error_status = b'413 Request Entity Too Large'
+        raise HttpParserError('Request body too large')
+
+    def on_message_complete(self):
+        environ = self._environ
+        body = b''.join(self._body)
+        environ['wsgi.input'] = BytesIO(body)
+        # Body is buffered, so its length is known even for chunked requests.
+        environ['CONTENT_LENGTH'] = str(len(body))
+        environ['wsgi.input_terminated'] = True
+        self._environ = self._body = self._url = None
+        self.continue_pending = False
+        if self.admission is not None:
+            self.admission.request_arrived(environ, self.loop.time())
+        self.enqueue_request(environ, self.parser.should_keep_alive())
+
+    def enqueue_request(self, environ, keep_alive):
+        self.requests.append((environ, keep_alive))
+        if len(self.requests) > self.max_pipelined_requests and not self.reading_paused:
+            self.reading_paused = True
+            self.transport.pause_reading()
+        if self.handler is None:
+            self.handler = asyncio.ensure_future(self.process_requests(), loop=self.loop)
+
+    def pause_writing(self):
+        if self.drain_waiter is None:
+            self.drain_waiter = self.loop.create_future()
+
+    def resume_writing(self):
+        waiter, self.drain_waiter = self.drain_waiter, None
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    async def drain(self):
+        if self.drain_waiter is not None:
+            await self.drain_waiter
+
+    async def process_requests(self):
+        try:
+            while self.requests and self.transport is not None:
+                environ, keep_alive = self.requests.popleft()
+                if self.reading_paused and len(self.requests) <= self.max_pipelined_requests // 2:
+                    self.reading_paused = False
+                    self.transport.resume_reading()
+
+                if environ is None:
+                    self.transport.write(b'HTTP/1.1 ' + self.error_status +
+                                         b'\r\nConnection: close\r\nContent-Length: 0\r\n\r\n')
+                    keep_alive = False
+                else:
+                    # Each request runs on its own task in order to get its own locals.
+                    keep_alive = await asyncio.ensure_future(self.handle_request(environ, keep_alive),
+                                                             loop=self.loop)
+
+                if not keep_alive or (self.half_closed and not self.requests):
+                    self.close()
+                    return
+
+            if self.continue_pending and self.transport is not None:
+                self.continue_pending = False
+                self.transport.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+        finally:
+            self.handler = None
+
+        self.set_idle()
+
+    async def handle_request(self, environ, keep_alive):
+        """
+        Runs WSGI application for a request and writes its response.
+
+        :return: Whether connection must be kept alive.
+        """
+        if self.transport is None:
+            # Connection was lost before request task started.
+            if self.admission is not None:
+                self.admission.request_finished(environ)
+            return False
+
+        app = self.app
+        if self.admission is not None:
+            app = self.admission.select_app(environ, app, self.loop.time())
+
+        response = self.response_class(self.transport, environ, keep_alive)
+        try:
+            await self.run_app(app, environ, response)
+        except Exception:
+            if self.passthrough_errors:
+                self.close()
+                raise
+            _log('error', 'Error on request:\n%s', traceback.format_exc())
+            if response.headers_sent or self.transport is None:
+                return False
+
+            from werkzeug.exceptions import InternalServerError
+            response = self.response_class(self.transport, environ, False)
+            await self.run_app(InternalServerError(), environ, response)
+        finally:
+            if self.admission is not None:
+                self.admission.request_finished(environ)
+
+        self.log_request(environ, response)
+        return response.keep_alive
+
+    async def run_app(self, app, environ, response):
+        result = app(environ, response.start_response)
+        if isinstance(result, asyncio.Future) or asyncio.iscoroutine(result):
+            result = await result
+        try:
+            for data in result:
+                if isinstance(data, asyncio.Future):
+                    data = await data
+                response.write(data)
+                if self.transport is None:
+                    return
+                await self.drain()
+            response.finish()
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+    def log_request(self, environ, response):
+        _log('info', '%s - - [%s] "%s %s %s" %s %s', environ['REMOTE_ADDR'],
+             time.strftime('%d/%b/%Y %H:%M:%S'), environ['REQUEST_METHOD'],
+             environ['REQUEST_URI'], environ['SERVER_PROTOCOL'], response.status[:3],
+             response.length or '-')
+
+
 def make_server(host, port, app=None, threaded=False, processes=1,
                 request_handler=None, passthrough_errors=False,
-                ssl_context=None, loop=None):
+                ssl_context=None, loop=None, handshake_metrics=None, admission=None,
+                sock=None, unix_socket_mode=None):
     if threaded or processes > 1:
         raise ValueError("Multi-thread or process servers not supported.")
 
     loop = loop or asyncio.get_event_loop()
-    asyncio.async(asyncio.get_event_loop().create_server(lambda: WSGIServerHttpProtocol(app, readpayload=True),
-                                                         host, port),
-                  loop=loop)
+    protocol_class = request_handler or WSGIServerProtocol
+
+    url_scheme = 'http'
+    if ssl_context is not None:
+        ssl_context = load_ssl_context(ssl_context)
+        url_scheme = 'https'
+
+    def protocol_factory():
+        return protocol_class(app, loop=loop, url_scheme=url_scheme,
+                              passthrough_errors=passthrough_errors,
+                              handshake_metrics=handshake_metrics,
+                              admission=admission)
+
+    if admission is not None:
+        admission.start(loop)
+
+    unix_socket_path = get_unix_socket_path(host)
+    if sock is None and unix_socket_path is not None:
+        sock = bind_unix_socket(unix_socket_path, unix_socket_mode)
+    if sock is not None:
+        return asyncio.ensure_future(loop.create_server(protocol_factory, sock=sock, ssl=ssl_context), loop=loop)
+
+    return asyncio.ensure_future(loop.create_server(protocol_factory, host, port, ssl=ssl_context), loop=loop)
 
 
 def run_simple(hostname, port, application, use_reloader=False,
@@ -26,7 +986,9 @@ def run_simple(hostname, port, application, use_reloader=False,
                extra_files=None, reloader_interval=1,
                reloader_type='auto', threaded=False, processes=1,
                request_handler=None, static_files=None,
-               passthrough_errors=False, ssl_context=None, loop=None):
+               passthrough_errors=False, ssl_context=None, loop=None,
+               admission=None, unix_socket_mode=None, socket_activation=False,
+               profiler=None):
     """Start a WSGI application. Optional features include a reloader,
     multithreading and fork support.
 
@@ -53,9 +1015,11 @@ def run_simple(hostname, port, application, use_reloader=False,
        through the `reloader_type` parameter.  See :ref:`reloader`
        for more information.
 
-    :param hostname: The host for the application.  eg: ``'localhost'``
+    :param hostname: The host for the application.  eg: ``'localhost'``.
+                     Unix sockets could be used with ``'unix:/path'``.
     :param port: The port for the server.  eg: ``8080``
-    :param application: the WSGI application to execute
+    :param application: the WSGI application to execute, or its import string
+                        in the form ``'module:app'``.
     :param use_reloader: should the server automatically restart the python
                          process if modules were changed?
     :param use_debugger: should the werkzeug debugging system be used?
@@ -65,22 +1029,24 @@ def run_simple(hostname, port, application, use_reloader=False,
                         files.
     :param reloader_interval: the interval for the reloader in seconds.
     :param reloader_type: the type of reloader to use.  The default is
-                          auto detection.  Valid values are ``'stat'`` and
-                          ``'watchdog'``. See :ref:`reloader` for more
-                          information.
+                          auto detection.  Valid values are ``'hachiko'`` and
+                          ``'inprocess'``, which reloads changed modules and
+                          their dependents without restarting the process. It
+                          requires `application` as an import string.
     :param threaded: should the process handle each request in a separate
                      thread?
     :param processes: if greater than 1 then handle each request in a new process
                       up to this maximum number of concurrent processes.
     :param request_handler: optional parameter that can be used to replace
                             the default one.  You can use this to replace it
-                            with a different
-                            :class:`~BaseHTTPServer.BaseHTTPRequestHandler`
+                            with a different :class:`~WSGIServerProtocol`
                             subclass.
     :param static_files: a dict of paths for static files.  This works exactly
                          like :class:`SharedDataMiddleware`, it's actually
-                         just wrapping the application in that middleware before
-                         serving.
+                         just wrapping the application in
+                         :class:`~aiowerkzeug.middleware.StaticFilesMiddleware`
+                         before serving. Precompressed ``.br`` and ``.gz``
+                         siblings are served when client accepts them.
     :param passthrough_errors: set this to `True` to disable the error catching.
                                This means that the server will die on errors but
                                it can be useful to hook debuggers in (pdb etc.)
@@ -89,38 +1055,83 @@ def run_simple(hostname, port, application, use_reloader=False,
                         ``(cert_file, pkey_file)``, the string ``'adhoc'`` if
                         the server should automatically create one, or ``None``
                         to disable SSL (which is the default).
+    :param admission: an :class:`~AdmissionController` to shed load when server
+                      is overloaded, or ``None`` to accept all requests (which
+                      is the default).
+    :param unix_socket_mode: file permissions for unix socket, eg: ``0o660``.
+    :param socket_activation: serve on sockets passed by systemd socket activation
+                              (``LISTEN_FDS``) instead of binding `hostname`.
+    :param profiler: a :class:`~aiowerkzeug.profiler.SamplingProfiler` to sample
+                     requests by route, or ``None`` to disable profiling (which
+                     is the default).
     """
     loop = loop or asyncio.get_event_loop()
 
     if use_debugger:
         raise NotImplemented("Debugger not implemented with asyncio")
+
+    reloadable = None
+    if use_reloader and reloader_type == 'inprocess':
+        if not isinstance(application, str):
+            raise ValueError("In process reloader requires application as an import string.")
+        from ._reloader import ReloadableApplication
+        application = reloadable = ReloadableApplication(application)
+    elif isinstance(application, str):
+        from werkzeug.utils import import_string
+        application = import_string(application)
+
     if static_files:
-        raise NotImplemented("Static files not implemented with asyncio")
+        from .middleware import StaticFilesMiddleware
+        application = StaticFilesMiddleware(application, static_files)
+    if profiler is not None:
+        from .profiler import ProfilerMiddleware
+        application = ProfilerMiddleware(application, profiler)
+
+    unix_socket_path = get_unix_socket_path(hostname)
+    sockets = [None]
+    if socket_activation:
+        if use_reloader:
+            raise ValueError("Socket activation is not supported with reloader.")
+        sockets = get_systemd_sockets()
+        if not sockets:
+            raise ValueError("No sockets passed by socket activation.")
 
     def inner(loop):
-        make_server(hostname, port, application, threaded,
-                    processes, request_handler,
-                    passthrough_errors, ssl_context, loop)
+        for sock in sockets:
+            make_server(hostname, port, application, threaded,
+                        processes, request_handler,
+                        passthrough_errors, ssl_context, loop,
+                        admission=admission, sock=sock,
+                        unix_socket_mode=unix_socket_mode)
+        if profiler is not None:
+            profiler.start(loop)
 
     if os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
-        display_hostname = hostname != '*' and hostname or 'localhost'
-        if ':' in display_hostname:
-            display_hostname = '[%s]' % display_hostname
         quit_msg = '(Press CTRL+C to quit)'
-        _log('info', ' * Running on %s://%s:%d/ %s', ssl_context is None
-             and 'http' or 'https', display_hostname, port, quit_msg)
+        if socket_activation:
+            _log('info', ' * Running on %d socket activated sockets %s', len(sockets), quit_msg)
+        elif unix_socket_path is not None:
+            _log('info', ' * Running on unix:%s %s', unix_socket_path, quit_msg)
+        else:
+            display_hostname = hostname != '*' and hostname or 'localhost'
+            if ':' in display_hostname:
+                display_hostname = '[%s]' % display_hostname
+            _log('info', ' * Running on %s://%s:%d/ %s', ssl_context is None
+                 and 'http' or 'https', display_hostname, port, quit_msg)
     if use_reloader:
-        # Create and destroy a socket so that any exceptions are raised before
-        # we spawn a separate Python interpreter and lose this ability.
-        address_family = select_ip_version(hostname, port)
-        test_socket = socket.socket(address_family, socket.SOCK_STREAM)
-        test_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        test_socket.bind((hostname, port))
-        test_socket.close()
+        if unix_socket_path is None:
+            # Create and destroy a socket so that any exceptions are raised before
+            # we spawn a separate Python interpreter and lose this ability.
+            from werkzeug.serving import select_ip_version
+            address_family = select_ip_version(hostname, port)
+            test_socket = socket.socket(address_family, socket.SOCK_STREAM)
+            test_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            test_socket.bind((hostname, port))
+            test_socket.close()
 
         from ._reloader import run_with_reloader
         run_with_reloader(inner, extra_files, reloader_interval,
-                          reloader_type, loop)
+                          reloader_type, loop, application=reloadable)
     else:
         inner(loop)
         loop.run_forever()
@@ -138,22 +1149,35 @@ def main():
 
     # in contrast to argparse, this works at least under Python < 2.7
     import optparse
-    from werkzeug.utils import import_string
 
     parser = optparse.OptionParser(
         usage='Usage: %prog [options] app_module:app_object')
     parser.add_option('-b', '--bind', dest='address',
-                      help='The hostname:port the app should listen on.')
+                      help='The hostname:port the app should listen on. Use unix:/path '
+                           'for a unix socket or systemd for socket activation.')
+    parser.add_option('--socket-mode', dest='socket_mode',
+                      help='File permissions of unix socket, in octal. eg: 660')
     parser.add_option('-d', '--debug', dest='use_debugger',
                       action='store_true', default=False,
                       help='Use Werkzeug\'s debugger.')
     parser.add_option('-r', '--reload', dest='use_reloader',
                       action='store_true', default=False,
                       help='Reload Python process if modules change.')
+    parser.add_option('--reload-in-process', dest='reload_in_process',
+                      action='store_true', default=False,
+                      help='Reload changed modules without restarting Python process.')
+    parser.add_option('--profile', dest='use_profiler',
+                      action='store_true', default=False,
+                      help='Sample requests by route. Collapsed stacks are dumped on SIGUSR1.')
     options, args = parser.parse_args()
 
     hostname, port = None, None
-    if options.address:
+    socket_activation = options.address == 'systemd'
+    if socket_activation:
+        pass
+    elif get_unix_socket_path(options.address) is not None:
+        hostname = options.address
+    elif options.address:
         address = options.address.split(':')
         hostname = address[0]
         if len(address) > 1:
@@ -162,12 +1186,19 @@ def main():
     if len(args) != 1:
         sys.stdout.write('No application supplied, or too much. See --help\n')
         sys.exit(1)
-    app = import_string(args[0])
+
+    profiler = None
+    if options.use_profiler:
+        from .profiler import SamplingProfiler
+        profiler = SamplingProfiler()
 
     run_simple(
         hostname=(hostname or '127.0.0.1'), port=int(port or 5000),
-        application=app, use_reloader=options.use_reloader,
-        use_debugger=options.use_debugger
+        application=args[0], use_reloader=options.use_reloader or options.reload_in_process,
+        reloader_type=options.reload_in_process and 'inprocess' or 'auto',
+        use_debugger=options.use_debugger,
+        unix_socket_mode=options.socket_mode and int(options.socket_mode, 8),
+        socket_activation=socket_activation, profiler=profiler
     )
 
 if __name__ == '__main__':
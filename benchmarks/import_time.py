@@ -0,0 +1,65 @@
+"""
+import_time.py
+
+Benchmark of cold start time of ``python -m aiowerkzeug.serving``. It runs command
+with ``-X importtime`` several times and it reports the best cumulative import time
+and the slowest imports.
+
+Usage::
+
+    $ python benchmarks/import_time.py --runs 10 --top 15
+"""
+import argparse
+import subprocess
+import sys
+
+__author__ = 'alfred'
+
+
+def measure(args):
+    """
+    Runs a python interpreter with ``-X importtime`` and returns imports times.
+
+    :return: List of tuples ``(module, self_us, cumulative_us)``.
+    """
+    proc = subprocess.run([sys.executable, '-X', 'importtime'] + args,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                          universal_newlines=True)
+
+    times = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        try:
+            self_us, cumulative_us, module = line[12:].split('|')
+            times.append((module.strip(), int(self_us), int(cumulative_us)))
+        except ValueError:
+            # Header line.
+            pass
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure cold start import time.')
+    parser.add_argument('--runs', type=int, default=5, help='Number of runs. Best one is reported.')
+    parser.add_argument('--top', type=int, default=10, help='Number of slowest imports to show.')
+    parser.add_argument('--module', default='aiowerkzeug.serving', help='Module to run.')
+    options = parser.parse_args()
+
+    best = None
+    for _ in range(options.runs):
+        times = measure(['-m', options.module, '--help'])
+        total = sum(t[1] for t in times)
+        if best is None or total < best[0]:
+            best = (total, times)
+
+    total, times = best
+    sys.stdout.write('Cold start imports of %s: %d modules, %.1f ms\n' % (options.module, len(times),
+                                                                          total / 1000))
+    sys.stdout.write('Slowest imports (cumulative):\n')
+    for module, self_us, cumulative_us in sorted(times, key=lambda t: t[2], reverse=True)[:options.top]:
+        sys.stdout.write('  %8.1f ms  %s\n' % (cumulative_us / 1000, module))
+
+
+if __name__ == '__main__':
+    main()
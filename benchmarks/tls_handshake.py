@@ -0,0 +1,101 @@
+"""
+tls_handshake.py
+
+Benchmark of full versus resumed TLS handshakes against a local server built by
+:func:`aiowerkzeug.serving.make_server`. Server runs on a thread and clients use
+blocking sockets, resumed handshakes reuse session from previous connection.
+
+Usage::
+
+    $ python benchmarks/tls_handshake.py --connections 200
+    $ python benchmarks/tls_handshake.py --cert server.crt --key server.key
+"""
+import argparse
+import asyncio
+import logging
+import socket
+import ssl
+import statistics
+import sys
+import threading
+import time
+from aiowerkzeug.serving import make_server, HandshakeMetrics
+
+__author__ = 'alfred'
+
+
+def app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain'), ('Content-Length', '2')])
+    return [b'ok']
+
+
+def serve(ssl_context, metrics):
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(make_server('127.0.0.1', 0, app, ssl_context=ssl_context,
+                                                 loop=loop, handshake_metrics=metrics))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    return server.sockets[0].getsockname()[1]
+
+
+def connect(port, client_context, session=None):
+    sock = socket.create_connection(('127.0.0.1', port))
+    start = time.perf_counter()
+    ssock = client_context.wrap_socket(sock, server_hostname='localhost', session=session)
+    elapsed = time.perf_counter() - start
+
+    # TLS 1.3 session tickets are received after handshake, so response must be read.
+    ssock.sendall(b'GET / HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n')
+    while ssock.recv(4096):
+        pass
+    session, reused = ssock.session, ssock.session_reused
+    ssock.close()
+    return elapsed, session, reused
+
+
+def report(name, times):
+    times = sorted(times)
+    sys.stdout.write('%-8s mean %7.3f ms  p50 %7.3f ms  p99 %7.3f ms\n' % (
+        name, statistics.mean(times) * 1000, times[len(times) // 2] * 1000,
+        times[min(len(times) - 1, int(len(times) * 0.99))] * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure full versus resumed TLS handshakes.')
+    parser.add_argument('--connections', type=int, default=100, help='Connections for each kind of handshake.')
+    parser.add_argument('--cert', help='Certificate file. Adhoc certificate is used by default.')
+    parser.add_argument('--key', help='Private key file.')
+    options = parser.parse_args()
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    ssl_context = (options.cert, options.key) if options.cert else 'adhoc'
+    metrics = HandshakeMetrics()
+    port = serve(ssl_context, metrics)
+
+    client_context = ssl.create_default_context()
+    client_context.check_hostname = False
+    client_context.verify_mode = ssl.CERT_NONE
+
+    full = [connect(port, client_context)[0] for _ in range(options.connections)]
+
+    resumed = []
+    _, session, _ = connect(port, client_context)
+    for _ in range(options.connections):
+        elapsed, session, reused = connect(port, client_context, session)
+        if reused:
+            resumed.append(elapsed)
+
+    sys.stdout.write('Client side handshake times:\n')
+    report('full', full)
+    if resumed:
+        report('resumed', resumed)
+    else:
+        sys.stdout.write('resumed  no session was resumed\n')
+
+    sys.stdout.write('Server metrics:\n')
+    for key, value in sorted(metrics.as_dict().items()):
+        sys.stdout.write('  %s: %s\n' % (key, value))
+
+
+if __name__ == '__main__':
+    main()
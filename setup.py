@@ -18,7 +18,9 @@ setup(
         'Development Status :: 3 - Alpha'],
     packages=['aiowerkzeug'],
     include_package_data=True,
-    install_requires=['werkzeug', 'hachiko', 'aiohttp'],
+    install_requires=['werkzeug', 'hachiko'],
+    extras_require={'httptools': ['httptools'],
+                    'brotli': ['brotli']},
     description="Werkzeug for asyncio",
     long_description=description,
     test_suite="nose.collector",
@@ -1,4 +1,6 @@
 import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from functools import partial
 from asyncio.coroutines import coroutine
 from asyncio.futures import Future
@@ -6,10 +8,13 @@ from asyncio.tasks import Task
 from asynctest.case import TestCase
 from werkzeug.local import Local, LocalStack
 from aiowerkzeug.local import identify_future, patch_local, context_coroutine, AsyncLocal, AsyncLocalStack, \
-    async_task_with_context, keep_context_factory, AsyncLocalManager
+    async_task_with_context, keep_context_factory, AsyncLocalManager, SharedContext, \
+    run_in_executor
 
 __author__ = 'alfred'
 
+process_local = AsyncLocal()
+
 
 class IdentifyTest(TestCase):
 
@@ -280,6 +285,120 @@ class LocalKeepContextFactoryTest(TestCase):
         self.assertEqual(fut.result(), 45)
 
 
+class SharedContextTest(TestCase):
+
+    use_default_loop = True
+
+    class CtxManager:
+
+        def __init__(self, local, counters):
+            self.local = local
+            self.counters = counters
+
+        def __enter__(self):
+            self.counters['enter'] += 1
+            self.local.test = 45
+
+        def __exit__(self, exc_type, exc_val, exc_tb):
+            self.counters['exit'] += 1
+            try:
+                del self.local.test
+            except AttributeError:
+                pass
+
+    def setUp(self):
+        self.local = AsyncLocal()
+        self.counters = {'build': 0, 'enter': 0, 'exit': 0}
+
+    def _build_context(self):
+        self.counters['build'] += 1
+        return self.CtxManager(self.local, self.counters)
+
+    async def test_nested_calls(self):
+        test_coroutine = partial(keep_context_factory, ctx=self._build_context, reuse=True)
+
+        @test_coroutine
+        async def leaf():
+            return self.local.test
+
+        @test_coroutine
+        async def other_context():
+            res = await leaf()
+            res += await leaf()
+            return res
+
+        fut = asyncio.ensure_future(other_context())
+        await fut
+        self.assertEqual(fut.result(), 90)
+        self.assertEqual(self.counters, {'build': 1, 'enter': 1, 'exit': 1})
+        self.assertIsNone(SharedContext.get_context_object(self._build_context))
+
+    async def test_not_reused_by_default(self):
+        test_coroutine = partial(keep_context_factory, ctx=self._build_context)
+
+        @test_coroutine
+        async def leaf():
+            return self.local.test
+
+        @test_coroutine
+        async def other_context():
+            return await leaf()
+
+        fut = asyncio.ensure_future(other_context())
+        await fut
+        self.assertEqual(fut.result(), 45)
+        self.assertEqual(self.counters, {'build': 2, 'enter': 2, 'exit': 2})
+
+    async def test_new_task_builds_context_object(self):
+        test_coroutine = partial(keep_context_factory, ctx=self._build_context, reuse=True)
+
+        @test_coroutine
+        async def leaf():
+            return self.local.test
+
+        @test_coroutine
+        async def other_context():
+            return await asyncio.ensure_future(leaf())
+
+        fut = asyncio.ensure_future(other_context())
+        await fut
+        self.assertEqual(fut.result(), 45)
+        self.assertEqual(self.counters, {'build': 2, 'enter': 2, 'exit': 2})
+
+    async def test_new_task_generator_context(self):
+
+        @contextmanager
+        def build_context():
+            self.counters['enter'] += 1
+            yield
+            self.counters['exit'] += 1
+
+        test_coroutine = partial(keep_context_factory, ctx=build_context, reuse=True)
+
+        @test_coroutine
+        async def leaf():
+            return 45
+
+        @test_coroutine
+        async def other_context():
+            return await asyncio.ensure_future(leaf())
+
+        self.assertEqual(await asyncio.ensure_future(other_context()), 45)
+        self.assertEqual(self.counters['enter'], 2)
+        self.assertEqual(self.counters['exit'], 2)
+
+    async def test_async_task_with_context(self):
+
+        async def other_context():
+            return self.local.test
+
+        fut = async_task_with_context(other_context(), ctx=self._build_context, loop=self.loop, reuse=True)
+        await fut
+
+        self.assertEqual(fut.result(), 45)
+        self.assertEqual(self.counters, {'build': 1, 'enter': 1, 'exit': 1})
+
+
 class AsyncTaskWithContextTest(TestCase):
 
     use_default_loop = True
@@ -354,3 +473,59 @@ class AsyncLocalManagerTest(TestCase):
         self.assertFalse(hasattr(local, 'test'))
         self.assertEqual(fut.result(), 45)
         self.assertNotIn(identify_future(fut), local.__storage__)
+
+
+class RunInExecutorTest(TestCase):
+
+    use_default_loop = True
+
+    async def test_thread_executor(self):
+        local = AsyncLocal()
+        stack = AsyncLocalStack()
+        local.test = 45
+        stack.push(40)
+
+        def worker():
+            stack.push(50)
+            local.test = 55
+            return local.test, stack.top
+
+        res = await run_in_executor(None, worker, local_objects=[local, stack], loop=self.loop)
+
+        self.assertEqual(res, (55, 50))
+        self.assertEqual(local.test, 45)
+        self.assertEqual(stack.top, 40)
+        self.assertEqual(len(local.__storage__), 1)
+        self.assertEqual(len(stack._local.__storage__), 1)
+
+    async def test_local_manager(self):
+        local = AsyncLocal()
+        local_man = AsyncLocalManager(locals=[local])
+        local.test = 45
+
+        def worker(value):
+            return local.test + value
+
+        res = await local_man.run_in_executor(None, worker, 5, loop=self.loop)
+        self.assertEqual(res, 50)
+
+    async def test_process_executor(self):
+        process_local.test = 45
+        try:
+            with ProcessPoolExecutor(1) as executor:
+                res = await run_in_executor(executor, _get_process_local,
+                                            local_objects=['tests.tests_local:process_local'], loop=self.loop)
+        finally:
+            process_local.__release_local__()
+
+        self.assertEqual(res, 45)
+        self.assertEqual(process_local.__storage__, {})
+
+    async def test_process_executor_fail(self):
+        with ProcessPoolExecutor(1) as executor:
+            with self.assertRaises(ValueError):
+                run_in_executor(executor, _get_process_local, local_objects=[process_local], loop=self.loop)
+
+
+def _get_process_local():
+    return process_local.test
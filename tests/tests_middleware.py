@@ -0,0 +1,398 @@
+import asyncio
+import gzip
+import os
+import shutil
+import tempfile
+from unittest import TestCase as SyncTestCase
+from asynctest.case import TestCase
+from aiowerkzeug.local import AsyncLocal
+from aiowerkzeug.middleware import CompressionMiddleware, StaticFilesMiddleware, CacheMiddleware, CacheStore, \
+    CachedResponse
+
+__author__ = 'alfred'
+
+
+def make_environ(path='/', accept_encoding='gzip'):
+    return {'REQUEST_METHOD': 'GET',
+            'PATH_INFO': path,
+            'SCRIPT_NAME': '',
+            'QUERY_STRING': '',
+            'HTTP_ACCEPT_ENCODING': accept_encoding}
+
+
+class StartResponse:
+
+    def __init__(self):
+        self.status = None
+        self.headers = None
+
+    def __call__(self, status, headers, exc_info=None):
+        self.status = status
+        self.headers = dict(headers)
+        return lambda data: None
+
+
+class CompressionMiddlewareTest(TestCase):
+
+    use_default_loop = True
+
+    def setUp(self):
+        self.body = [b'a' * 1000, b'b' * 1000]
+        self.headers = [('Content-Type', 'text/plain')]
+        self.middleware = CompressionMiddleware(self.app, offload_size=1500, loop=self.loop)
+        self.start_response = StartResponse()
+
+    def app(self, environ, start_response):
+        start_response('200 OK', self.headers)
+        return self.body
+
+    async def read_body(self, result):
+        body = []
+        for data in result:
+            if isinstance(data, asyncio.Future):
+                data = await data
+            body.append(data)
+        return b''.join(body)
+
+    async def test_compress(self):
+        body = await self.read_body(self.middleware(make_environ(), self.start_response))
+
+        self.assertEqual(self.start_response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(self.start_response.headers['Vary'], 'Accept-Encoding')
+        self.assertNotIn('Content-Length', self.start_response.headers)
+        self.assertEqual(gzip.decompress(body), b''.join(self.body))
+
+    async def test_offload(self):
+        self.body = [b'a' * 2000]
+        result = self.middleware(make_environ(), self.start_response)
+
+        chunks = iter(result)
+        chunk = next(chunks)
+        self.assertIsInstance(chunk, asyncio.Future)
+        body = await chunk
+        body += b''.join(chunks)
+        self.assertEqual(gzip.decompress(body), b''.join(self.body))
+
+    async def test_offload_small_chunks(self):
+        self.body = [b'a' * 500] * 8
+        offloaded = 0
+        body = b''
+        for data in self.middleware(make_environ(), self.start_response):
+            if isinstance(data, asyncio.Future):
+                offloaded += 1
+                data = await data
+            body += data
+
+        self.assertEqual(offloaded, 2)
+        self.assertEqual(gzip.decompress(body), b''.join(self.body))
+
+    async def test_weak_etag(self):
+        self.headers.append(('ETag', '"abc"'))
+        await self.read_body(self.middleware(make_environ(), self.start_response))
+
+        self.assertEqual(self.start_response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(self.start_response.headers['ETag'], 'W/"abc"')
+
+    async def test_etag_not_compressed(self):
+        self.headers.append(('ETag', '"abc"'))
+        await self.read_body(self.middleware(make_environ(accept_encoding='identity'), self.start_response))
+
+        self.assertEqual(self.start_response.headers['ETag'], '"abc"')
+
+    async def test_small_body(self):
+        self.body = [b'a' * 10, b'b' * 10]
+        body = await self.read_body(self.middleware(make_environ(), self.start_response))
+
+        self.assertNotIn('Content-Encoding', self.start_response.headers)
+        self.assertEqual(self.start_response.headers['Content-Length'], '20')
+        self.assertEqual(body, b''.join(self.body))
+
+    async def test_small_content_length(self):
+        self.headers.append(('Content-Length', '20'))
+        self.body = [b'a' * 20]
+        body = await self.read_body(self.middleware(make_environ(), self.start_response))
+
+        self.assertNotIn('Content-Encoding', self.start_response.headers)
+        self.assertEqual(body, b''.join(self.body))
+
+    async def test_already_compressed(self):
+        self.headers = [('Content-Type', 'image/png')]
+        body = await self.read_body(self.middleware(make_environ(), self.start_response))
+
+        self.assertNotIn('Content-Encoding', self.start_response.headers)
+        self.assertEqual(body, b''.join(self.body))
+
+    async def test_not_accepted(self):
+        body = await self.read_body(self.middleware(make_environ(accept_encoding='identity'),
+                                                    self.start_response))
+
+        self.assertNotIn('Content-Encoding', self.start_response.headers)
+        self.assertEqual(body, b''.join(self.body))
+
+    async def test_future_chunks(self):
+        fut = asyncio.Future(loop=self.loop)
+        self.loop.call_soon(fut.set_result, b'a' * 1000)
+        self.body = [fut, b'b' * 1000]
+        body = await self.read_body(self.middleware(make_environ(), self.start_response))
+
+        self.assertEqual(self.start_response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(body), b'a' * 1000 + b'b' * 1000)
+
+    async def test_lazy_start_response(self):
+
+        def app(environ, start_response):
+            fut = asyncio.Future(loop=self.loop)
+
+            def resolve():
+                start_response('200 OK', self.headers)
+                fut.set_result(b'a' * 10)
+
+            self.loop.call_soon(resolve)
+            return [fut]
+
+        self.middleware.app = app
+        body = await self.read_body(self.middleware(make_environ(), self.start_response))
+
+        self.assertEqual(self.start_response.status, '200 OK')
+        self.assertEqual(self.start_response.headers['Content-Length'], '10')
+        self.assertEqual(body, b'a' * 10)
+
+    async def test_cache_middleware(self):
+        self.body = [b'a' * 1000]
+        self.headers.append(('Cache-Control', 'max-age=60'))
+        self.middleware.app = CacheMiddleware(self.app, loop=self.loop)
+
+        for _ in range(2):
+            start_response = StartResponse()
+            body = await self.read_body(self.middleware(make_environ(), start_response))
+
+            self.assertEqual(start_response.headers['Content-Encoding'], 'gzip')
+            self.assertEqual(gzip.decompress(body), b'a' * 1000)
+
+
+class StaticFilesMiddlewareTest(SyncTestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        with open(os.path.join(self.path, 'app.js'), 'wb') as f:
+            f.write(b'plain')
+        with open(os.path.join(self.path, 'app.js.gz'), 'wb') as f:
+            f.write(b'gzipped')
+
+        self.middleware = StaticFilesMiddleware(self.app, {'/static': self.path})
+        self.start_response = StartResponse()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def app(self, environ, start_response):
+        start_response('404 NOT FOUND', [])
+        return [b'not found']
+
+    def test_precompressed(self):
+        result = self.middleware(make_environ('/static/app.js'), self.start_response)
+
+        self.assertEqual(b''.join(result), b'gzipped')
+        self.assertEqual(self.start_response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('javascript', self.start_response.headers['Content-Type'])
+
+    def test_not_accepted(self):
+        result = self.middleware(make_environ('/static/app.js', accept_encoding=''), self.start_response)
+
+        self.assertEqual(b''.join(result), b'plain')
+        self.assertNotIn('Content-Encoding', self.start_response.headers)
+
+    def test_not_found(self):
+        result = self.middleware(make_environ('/static/foo.js'), self.start_response)
+
+        self.assertEqual(b''.join(result), b'not found')
+        self.assertEqual(self.start_response.status, '404 NOT FOUND')
+
+
+class CacheMiddlewareTest(TestCase):
+
+    use_default_loop = True
+
+    def setUp(self):
+        self.calls = 0
+        self.headers = [('Content-Type', 'text/plain'), ('Cache-Control', 'max-age=60')]
+        self.delay = None
+        self.local = AsyncLocal()
+        self.middleware = CacheMiddleware(self.app, loop=self.loop)
+
+    def app(self, environ, start_response):
+        self.calls += 1
+        self.local.path = environ['PATH_INFO']
+        start_response('200 OK', self.headers)
+        body = ('%s %d' % (environ['PATH_INFO'], self.calls)).encode()
+        if self.delay is None:
+            return [body]
+
+        fut = asyncio.Future(loop=self.loop)
+        self.loop.call_later(self.delay, fut.set_result, body)
+        return [fut]
+
+    async def request(self, path='/', **environ):
+        start_response = StartResponse()
+        env = make_environ(path)
+        env.update(environ)
+        result = self.middleware(env, start_response)
+        body = []
+        try:
+            for data in result:
+                if isinstance(data, asyncio.Future):
+                    data = await data
+                body.append(data)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        # Application must run on the task which consumes its response.
+        start_response.local_path = getattr(self.local, 'path', None)
+        self.local.__release_local__()
+        return start_response, b''.join(body)
+
+    async def test_hit(self):
+        _, body = await self.request()
+        start_response, cached_body = await self.request()
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(cached_body, body)
+        self.assertEqual(start_response.headers['Age'], '0')
+
+    async def test_query_string(self):
+        await self.request()
+        await self.request(QUERY_STRING='foo=1')
+
+        self.assertEqual(self.calls, 2)
+
+    async def test_coalesce(self):
+        self.delay = 0.01
+        results = await asyncio.gather(self.request(), self.request(), self.request())
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual([body for _, body in results], [b'/ 1'] * 3)
+
+    async def test_coalesce_not_storable(self):
+        self.delay = 0.01
+        self.headers = [('Content-Type', 'text/plain'), ('Cache-Control', 'private')]
+        results = await asyncio.gather(self.request(), self.request())
+
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(sorted(body for _, body in results), [b'/ 1', b'/ 2'])
+        self.assertEqual([start_response.local_path for start_response, _ in results], ['/', '/'])
+
+    async def test_not_storable_not_serialized(self):
+        self.delay = 0.1
+        self.headers = [('Content-Type', 'text/plain')]
+        start = self.loop.time()
+        await asyncio.gather(self.request(), self.request(), self.request())
+
+        self.assertEqual(self.calls, 3)
+        self.assertLess(self.loop.time() - start, 0.18)
+
+    async def test_stream(self):
+        first = asyncio.Future(loop=self.loop)
+        second = asyncio.Future(loop=self.loop)
+
+        def app(environ, start_response):
+            self.calls += 1
+            start_response('200 OK', self.headers)
+            return [first, second]
+
+        self.middleware.app = app
+        result = iter(self.middleware(make_environ(), StartResponse()))
+
+        self.assertIs(next(result), first)
+        first.set_result(b'a')
+        self.assertEqual(await first, b'a')
+        self.assertIs(next(result), second)
+        second.set_result(b'b')
+        await second
+        self.assertEqual(list(result), [])
+
+        _, body = await self.request()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(body, b'ab')
+
+    async def test_leader_closed(self):
+        self.delay = 0.01
+        leader = self.middleware(make_environ(), StartResponse())
+        follower = asyncio.ensure_future(self.request())
+        await asyncio.sleep(0)
+        leader.close()
+
+        _, body = await follower
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(body, b'/ 2')
+
+    async def test_host(self):
+        await self.request(HTTP_HOST='a.example.com')
+        _, body = await self.request(HTTP_HOST='b.example.com')
+
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(body, b'/ 2')
+
+    async def test_no_store(self):
+        self.headers = [('Content-Type', 'text/plain'), ('Cache-Control', 'no-store')]
+        await self.request()
+        await self.request()
+
+        self.assertEqual(self.calls, 2)
+
+    async def test_request_no_cache(self):
+        await self.request()
+        _, body = await self.request(HTTP_CACHE_CONTROL='no-cache')
+
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(body, b'/ 2')
+
+    async def test_vary(self):
+        self.headers.append(('Vary', 'Accept-Language'))
+        await self.request(HTTP_ACCEPT_LANGUAGE='es')
+        await self.request(HTTP_ACCEPT_LANGUAGE='en')
+        _, body = await self.request(HTTP_ACCEPT_LANGUAGE='es')
+
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(body, b'/ 1')
+
+    async def test_stale_while_revalidate(self):
+        self.headers = [('Content-Type', 'text/plain'),
+                        ('Cache-Control', 'max-age=60, stale-while-revalidate=60')]
+        await self.request()
+        for response in self.middleware.store._entries[self.middleware.make_key(make_environ())]:
+            response.expires -= 100
+
+        _, body = await self.request()
+        self.assertEqual(body, b'/ 1')
+
+        while self.middleware.revalidating:
+            await asyncio.sleep(0)
+
+        _, body = await self.request()
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(body, b'/ 2')
+
+
+class CacheStoreTest(SyncTestCase):
+
+    def make_response(self, body):
+        return CachedResponse('200 OK', [], body, created=0, expires=10, stale_until=10, storable=True)
+
+    def test_lru(self):
+        store = CacheStore(max_size=700)
+        store.set('a', self.make_response(b'a' * 100))
+        store.set('b', self.make_response(b'b' * 100))
+        store.get('a', {}, 0)
+        store.set('c', self.make_response(b'c' * 100))
+
+        self.assertIsNotNone(store.get('a', {}, 0))
+        self.assertIsNone(store.get('b', {}, 0))
+        self.assertIsNotNone(store.get('c', {}, 0))
+        self.assertEqual(store.size, 600)
+
+    def test_expired(self):
+        store = CacheStore()
+        store.set('a', self.make_response(b'a'))
+
+        self.assertIsNone(store.get('a', {}, 10))
+        self.assertEqual(store.size, 0)
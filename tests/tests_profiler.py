@@ -0,0 +1,165 @@
+import asyncio
+import os
+import sys
+import tempfile
+from functools import partial
+from asynctest.case import TestCase
+from aiowerkzeug.local import keep_context_factory, context_coroutine
+from aiowerkzeug.profiler import SamplingProfiler, ProfilerMiddleware, NO_REQUEST
+
+__author__ = 'alfred'
+
+
+class StartResponse:
+
+    def __call__(self, status, headers, exc_info=None):
+        self.status = status
+        self.headers = dict(headers)
+        return lambda data: None
+
+
+def make_environ(path='/', query_string=''):
+    return {'REQUEST_METHOD': 'GET',
+            'PATH_INFO': path,
+            'QUERY_STRING': query_string}
+
+
+class SamplingProfilerTest(TestCase):
+
+    use_default_loop = True
+
+    def setUp(self):
+        self.dump_path = tempfile.mktemp()
+        self.profiler = SamplingProfiler(dump_path=self.dump_path, dump_signal=None, admin_path='/_profiler')
+        self.profiler.loop = self.loop
+        self.middleware = ProfilerMiddleware(self.app, self.profiler)
+
+    def tearDown(self):
+        if os.path.exists(self.dump_path):
+            os.remove(self.dump_path)
+
+    def app(self, environ, start_response):
+        self.profiler.sample(sys._getframe())
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [b'ok']
+
+    async def test_route(self):
+        result = self.middleware(make_environ('/foo'), StartResponse())
+
+        self.assertEqual(self.profiler.request_local.route, 'GET /foo')
+        result.close()
+        self.assertIsNone(getattr(self.profiler.request_local, 'route', None))
+
+        self.assertEqual(self.profiler.route_samples['GET /foo'], 1)
+        stack, count = self.profiler.format_collapsed().splitlines()[0].rsplit(' ', 1)
+        frames = stack.split(';')
+        self.assertEqual(frames[0], 'GET /foo')
+        self.assertTrue(frames[-1].startswith('app ('))
+        self.assertEqual(count, '1')
+
+    async def test_app_error(self):
+        def app(environ, start_response):
+            raise ValueError('Boom')
+
+        self.middleware.app = app
+        with self.assertRaises(ValueError):
+            self.middleware(make_environ('/foo'), StartResponse())
+
+        self.assertIsNone(getattr(self.profiler.request_local, 'route', None))
+
+    async def test_no_request(self):
+        self.profiler.sample(sys._getframe())
+
+        self.assertEqual(self.profiler.route_samples[NO_REQUEST], 1)
+
+    async def test_context(self):
+        profiler = self.profiler
+
+        class Context:
+
+            def __enter__(self):
+                profiler.sample(sys._getframe())
+
+            def __exit__(self, exc_type, exc_val, exc_tb):
+                pass
+
+        async def handler():
+            profiler.sample(sys._getframe())
+
+        async def request():
+            profiler.request_local.route = 'GET /ctx'
+            await keep_context_factory(handler, Context)()
+
+        await asyncio.ensure_future(request())
+
+        self.assertEqual(profiler.route_samples['GET /ctx'], 2)
+        self.assertEqual(profiler.context_samples['GET /ctx'], 1)
+        self.assertIn('50.0%', profiler.format_report().splitlines()[1])
+
+    async def test_context_coroutine(self):
+        profiler = self.profiler
+
+        class Context:
+
+            def __enter__(self):
+                profiler.sample(sys._getframe())
+
+            def __exit__(self, exc_type, exc_val, exc_tb):
+                pass
+
+        @partial(context_coroutine, ctx=Context)
+        def handler():
+            profiler.sample(sys._getframe())
+            return 45
+
+        profiler.request_local.route = 'GET /coro'
+        try:
+            with self.assertRaises(StopIteration) as cm:
+                handler().send(None)
+        finally:
+            profiler.request_local.__release_local__()
+
+        self.assertEqual(cm.exception.value, 45)
+        self.assertEqual(profiler.route_samples['GET /coro'], 2)
+        self.assertEqual(profiler.context_samples['GET /coro'], 1)
+
+    async def test_max_depth(self):
+        self.profiler.max_depth = 2
+        self.profiler.sample(sys._getframe())
+
+        stack = self.profiler.format_collapsed().rsplit(' ', 1)[0]
+        self.assertEqual(len(stack.split(';')), 3)
+
+    async def test_admin(self):
+        self.middleware(make_environ('/foo'), StartResponse()).close()
+
+        start_response = StartResponse()
+        body = b''.join(self.middleware(make_environ('/_profiler', 'reset=1'), start_response))
+
+        self.assertEqual(start_response.status, '200 OK')
+        self.assertTrue(body.startswith(b'GET /foo;'))
+        self.assertEqual(self.profiler.samples, {})
+
+    async def test_admin_report(self):
+        self.middleware(make_environ('/foo'), StartResponse()).close()
+        body = b''.join(self.middleware(make_environ('/_profiler', 'format=report'), StartResponse()))
+
+        self.assertIn(b'100.0%', body)
+        self.assertIn(b'GET /foo', body)
+
+    async def test_dump(self):
+        self.middleware(make_environ('/foo'), StartResponse()).close()
+        self.profiler.dump()
+
+        with open(self.dump_path) as f:
+            self.assertEqual(f.read(), self.profiler.format_collapsed())
+
+    async def test_sampling_thread(self):
+        self.profiler.interval = 0.001
+        self.profiler.start(self.loop)
+        try:
+            await asyncio.sleep(0.05)
+        finally:
+            self.profiler.stop()
+
+        self.assertGreater(sum(self.profiler.route_samples.values()), 0)
@@ -0,0 +1,165 @@
+import os
+import shutil
+import sys
+import tempfile
+from unittest import TestCase as SyncTestCase
+from asynctest.case import TestCase
+from aiowerkzeug._reloader import ModuleGraph, ReloadableApplication, InProcessReloaderLoop
+
+__author__ = 'alfred'
+
+
+APP_SOURCE = '''
+from reload_pkg.views import index
+
+
+def app(environ, start_response):
+    start_response('200 OK', [])
+    return [index()]
+'''
+
+VIEWS_SOURCE = '''
+def index():
+    return %r
+'''
+
+ROUTES_APP_SOURCE = '''
+from .routes import routes
+
+
+def app(environ, start_response):
+    start_response('200 OK', [])
+    return [routes[environ['PATH_INFO']]()]
+'''
+
+ROUTES_SOURCE = '''
+def index():
+    return %r
+
+
+routes = {'/': index}
+'''
+
+
+class ReloadTestMixin:
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        package = os.path.join(self.path, 'reload_pkg')
+        os.mkdir(package)
+        self.write('__init__.py', '')
+        self.write('app.py', APP_SOURCE)
+        self.write('views.py', VIEWS_SOURCE % b'first')
+        self.write('other.py', 'VALUE = 1\n')
+        self.write('routes_app.py', ROUTES_APP_SOURCE)
+        self.write('routes.py', ROUTES_SOURCE % b'first')
+
+        sys.path.insert(0, self.path)
+        sys.dont_write_bytecode, self.dont_write_bytecode = True, sys.dont_write_bytecode
+        self.application = ReloadableApplication('reload_pkg.app:app')
+        __import__('reload_pkg.other')
+
+    def tearDown(self):
+        sys.dont_write_bytecode = self.dont_write_bytecode
+        sys.path.remove(self.path)
+        for name in list(sys.modules):
+            if name.startswith('reload_pkg'):
+                del sys.modules[name]
+        shutil.rmtree(self.path)
+
+    def write(self, filename, source):
+        filename = os.path.join(self.path, 'reload_pkg', filename)
+        with open(filename, 'w') as f:
+            f.write(source)
+        return filename
+
+    def request(self):
+        return b''.join(self.application({'PATH_INFO': '/'}, lambda status, headers: None))
+
+
+class ModuleGraphTest(ReloadTestMixin, SyncTestCase):
+
+    def setUp(self):
+        super(ModuleGraphTest, self).setUp()
+        self.graph = ModuleGraph([self.path])
+        self.graph.build()
+
+    def test_files(self):
+        self.assertEqual(self.graph.files[os.path.join(self.path, 'reload_pkg', 'views.py')], 'reload_pkg.views')
+        self.assertNotIn('os', self.graph.dependents)
+
+    def test_dependents(self):
+        self.assertEqual(self.graph.dependents['reload_pkg.views'], {'reload_pkg', 'reload_pkg.app'})
+        self.assertEqual(self.graph.dependents['reload_pkg.app'], {'reload_pkg'})
+
+    def test_imported_objects(self):
+        __import__('reload_pkg.routes_app')
+        self.graph.build()
+
+        self.assertEqual(self.graph.dependents['reload_pkg.routes'], {'reload_pkg', 'reload_pkg.routes_app'})
+
+    def test_reload_order(self):
+        self.assertEqual(self.graph.get_reload_order(['reload_pkg.views']),
+                         ['reload_pkg.views', 'reload_pkg.app', 'reload_pkg'])
+        self.assertEqual(self.graph.get_reload_order(['reload_pkg.other']),
+                         ['reload_pkg.other', 'reload_pkg'])
+
+
+class InProcessReloaderLoopTest(ReloadTestMixin, TestCase):
+
+    use_default_loop = True
+
+    def setUp(self):
+        super(InProcessReloaderLoopTest, self).setUp()
+        self.extra_file = os.path.join(self.path, 'settings.cfg')
+        self.reloader = InProcessReloaderLoop(extra_files=[self.extra_file], loop=self.loop,
+                                              application=self.application, project_paths=[self.path])
+
+    def test_reload(self):
+        app = self.application.app
+        self.assertEqual(self.request(), b'first')
+
+        filename = self.write('views.py', VIEWS_SOURCE % b'second!')
+        self.assertTrue(self.reloader.reload({filename}))
+
+        self.assertEqual(self.request(), b'second!')
+        self.assertIsNot(self.application.app, app)
+
+    def test_reload_imported_object(self):
+        self.reloader.application = self.application = ReloadableApplication('reload_pkg.routes_app:app')
+        self.assertEqual(self.request(), b'first')
+
+        filename = self.write('routes.py', ROUTES_SOURCE % b'second!')
+        self.assertTrue(self.reloader.reload({filename}))
+
+        self.assertEqual(self.request(), b'second!')
+
+    def test_reload_not_application(self):
+        app = self.application.app
+        filename = self.write('other.py', 'VALUE = 2\n')
+
+        self.assertFalse(self.reloader.reload({filename}))
+        self.assertIs(self.application.app, app)
+
+    def test_reload_not_imported(self):
+        app = self.application.app
+        filename = self.write('new.py', 'VALUE = 1\n')
+
+        self.assertTrue(self.reloader.reload({filename}))
+        self.assertIs(self.application.app, app)
+
+    def test_reload_failed(self):
+        app = self.application.app
+        filename = self.write('views.py', 'def index(:\n')
+
+        self.assertFalse(self.reloader.reload({filename}))
+        self.assertIs(self.application.app, app)
+
+    def test_extra_file(self):
+        self.assertFalse(self.reloader.reload({self.extra_file}))
+
+    def test_no_application(self):
+        self.reloader.application = None
+        filename = os.path.join(self.path, 'reload_pkg', 'views.py')
+
+        self.assertFalse(self.reloader.reload({filename}))
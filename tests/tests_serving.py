@@ -0,0 +1,600 @@
+import asyncio
+import os
+import shutil
+import socket
+import ssl
+import stat
+import tempfile
+from unittest.mock import patch
+from werkzeug.wsgi import ClosingIterator
+from asynctest.case import TestCase
+from unittest import TestCase as SyncTestCase, skipIf
+from aiowerkzeug.local import AsyncLocal
+from aiowerkzeug.serving import httptools, PyHttpRequestParser, HttpParserError, WSGIServerProtocol, HandshakeMetrics, \
+    load_ssl_context, AdmissionController, get_unix_socket_path, bind_unix_socket, get_systemd_sockets, make_server
+
+__author__ = 'alfred'
+
+
+class FakeTransport:
+
+    def __init__(self):
+        self.data = bytearray()
+        self.closed = False
+        self.reading = True
+
+    def get_extra_info(self, name, default=None):
+        return {'sockname': ('127.0.0.1', 5000),
+                'peername': ('127.0.0.1', 40000)}.get(name, default)
+
+    def write(self, data):
+        self.data += data
+
+    def writelines(self, lines):
+        for data in lines:
+            self.write(data)
+
+    def close(self):
+        self.closed = True
+
+    def pause_reading(self):
+        self.reading = False
+
+    def resume_reading(self):
+        self.reading = True
+
+
+class RecorderProtocol:
+
+    def __init__(self):
+        self.messages = []
+
+    def on_message_begin(self):
+        self.messages.append({'url': b'', 'headers': [], 'body': b'', 'complete': False})
+
+    def on_url(self, url):
+        self.messages[-1]['url'] += url
+
+    def on_header(self, name, value):
+        self.messages[-1]['headers'].append((name, value))
+
+    def on_headers_complete(self):
+        pass
+
+    def on_body(self, body):
+        self.messages[-1]['body'] += body
+
+    def on_message_complete(self):
+        self.messages[-1]['complete'] = True
+
+
+class PyHttpRequestParserTest(SyncTestCase):
+
+    def setUp(self):
+        self.protocol = RecorderProtocol()
+        self.parser = PyHttpRequestParser(self.protocol)
+
+    def test_simple_request(self):
+        self.parser.feed_data(b'GET /foo?bar=1 HTTP/1.1\r\nHost: localhost\r\n\r\n')
+
+        self.assertEqual(self.parser.get_method(), b'GET')
+        self.assertEqual(self.parser.get_http_version(), '1.1')
+        self.assertTrue(self.parser.should_keep_alive())
+        self.assertEqual(self.protocol.messages, [{'url': b'/foo?bar=1',
+                                                   'headers': [(b'Host', b'localhost')],
+                                                   'body': b'',
+                                                   'complete': True}])
+
+    def test_split_request(self):
+        data = b'POST / HTTP/1.0\r\nContent-Length: 4\r\n\r\nbody'
+        for i in range(len(data)):
+            self.parser.feed_data(data[i:i + 1])
+
+        self.assertFalse(self.parser.should_keep_alive())
+        self.assertEqual(self.protocol.messages[0]['body'], b'body')
+        self.assertTrue(self.protocol.messages[0]['complete'])
+
+    def test_chunked_request(self):
+        self.parser.feed_data(b'POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n'
+                              b'4\r\nbody\r\n3;ext=1\r\nfoo\r\n0\r\n\r\n')
+
+        self.assertEqual(self.protocol.messages[0]['body'], b'bodyfoo')
+        self.assertTrue(self.protocol.messages[0]['complete'])
+
+    def test_chunked_with_content_length(self):
+        with self.assertRaises(HttpParserError):
+            self.parser.feed_data(b'POST / HTTP/1.1\r\nContent-Length: 4\r\nTransfer-Encoding: chunked\r\n\r\n'
+                                  b'3\r\nfoo\r\n0\r\n\r\n')
+
+        self.assertFalse(self.protocol.messages[0]['complete'])
+
+    def test_pipelined_requests(self):
+        self.parser.feed_data(b'GET /a HTTP/1.1\r\n\r\nPOST /b HTTP/1.1\r\nContent-Length: 1\r\n\r\n1'
+                              b'GET /c HTTP/1.1\r\n')
+
+        self.assertEqual([m['url'] for m in self.protocol.messages], [b'/a', b'/b', b'/c'])
+        self.assertEqual([m['complete'] for m in self.protocol.messages], [True, True, False])
+
+    def test_invalid_request_line(self):
+        with self.assertRaises(HttpParserError):
+            self.parser.feed_data(b'GET /\r\n\r\n')
+
+    def test_invalid_header(self):
+        with self.assertRaises(HttpParserError):
+            self.parser.feed_data(b'GET / HTTP/1.1\r\nHost\r\n\r\n')
+
+
+class WSGIServerProtocolTest(TestCase):
+
+    use_default_loop = True
+
+    def setUp(self):
+        self.environs = []
+        self.local = AsyncLocal()
+        self.transport = FakeTransport()
+        self.protocol = WSGIServerProtocol(self.app, loop=self.loop)
+        self.protocol.parser_class = PyHttpRequestParser
+        self.protocol.connection_made(self.transport)
+
+    def tearDown(self):
+        self.protocol.connection_lost(None)
+
+    def app(self, environ, start_response):
+        if hasattr(self.local, 'path'):
+            raise AssertionError('Locals shared between requests')
+        self.local.path = environ['PATH_INFO']
+        self.environs.append(environ)
+
+        if environ['PATH_INFO'] == '/error':
+            self.local.__release_local__()
+            raise ValueError()
+
+        body = environ['wsgi.input'].read()
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        # Locals are released like a local manager does, so task ids could be reused.
+        return ClosingIterator([environ['PATH_INFO'].encode(), body], self.local.__release_local__)
+
+    async def wait_requests(self):
+        while self.protocol.handler is not None:
+            await asyncio.sleep(0)
+
+    async def test_environ(self):
+        self.protocol.data_received(b'POST /foo%20bar?baz=1 HTTP/1.1\r\nHost: localhost\r\n'
+                                    b'Content-Type: text/plain\r\nContent-Length: 4\r\n'
+                                    b'X-Foo: 1\r\nX-Foo: 2\r\n\r\nbody')
+        await self.wait_requests()
+
+        environ = self.environs[0]
+        self.assertEqual(environ['REQUEST_METHOD'], 'POST')
+        self.assertEqual(environ['PATH_INFO'], '/foo bar')
+        self.assertEqual(environ['QUERY_STRING'], 'baz=1')
+        self.assertEqual(environ['SERVER_PROTOCOL'], 'HTTP/1.1')
+        self.assertEqual(environ['SERVER_NAME'], '127.0.0.1')
+        self.assertEqual(environ['SERVER_PORT'], '5000')
+        self.assertEqual(environ['REMOTE_ADDR'], '127.0.0.1')
+        self.assertEqual(environ['HTTP_HOST'], 'localhost')
+        self.assertEqual(environ['CONTENT_TYPE'], 'text/plain')
+        self.assertEqual(environ['CONTENT_LENGTH'], '4')
+        self.assertEqual(environ['HTTP_X_FOO'], '1,2')
+
+    async def test_pipelined_requests(self):
+        self.protocol.data_received(b'GET /a HTTP/1.1\r\n\r\nPOST /b HTTP/1.1\r\n'
+                                    b'Content-Length: 3\r\n\r\nfoo')
+        await self.wait_requests()
+
+        self.assertEqual([e['PATH_INFO'] for e in self.environs], ['/a', '/b'])
+        response = bytes(self.transport.data)
+        self.assertLess(response.index(b'2\r\n/a\r\n'), response.index(b'2\r\n/b\r\n3\r\nfoo\r\n0\r\n\r\n'))
+        self.assertFalse(self.transport.closed)
+
+    async def test_http10_close(self):
+        self.protocol.data_received(b'GET /a HTTP/1.0\r\n\r\n')
+        await self.wait_requests()
+
+        response = bytes(self.transport.data)
+        self.assertTrue(response.startswith(b'HTTP/1.1 200 OK\r\n'))
+        self.assertIn(b'Connection: close\r\n', response)
+        self.assertTrue(response.endswith(b'\r\n\r\n/a'))
+        self.assertTrue(self.transport.closed)
+
+    async def test_half_closed(self):
+        self.protocol.data_received(b'GET /a HTTP/1.1\r\n\r\nGET /b HTTP/1.1\r\n\r\n')
+        self.assertTrue(self.protocol.eof_received())
+        self.assertFalse(self.transport.closed)
+        await self.wait_requests()
+
+        response = bytes(self.transport.data)
+        self.assertIn(b'2\r\n/a\r\n', response)
+        self.assertIn(b'Connection: close\r\n', response)
+        self.assertTrue(response.endswith(b'2\r\n/b\r\n0\r\n\r\n'))
+        self.assertTrue(self.transport.closed)
+
+    async def test_half_closed_while_handling(self):
+        self.protocol.data_received(b'GET /a HTTP/1.1\r\n\r\n')
+        await asyncio.sleep(0)
+        self.assertEqual(len(self.protocol.requests), 0)
+        self.assertTrue(self.protocol.eof_received())
+        await self.wait_requests()
+
+        self.assertTrue(bytes(self.transport.data).endswith(b'2\r\n/a\r\n0\r\n\r\n'))
+        self.assertTrue(self.transport.closed)
+
+    async def test_half_closed_idle(self):
+        self.assertFalse(self.protocol.eof_received())
+
+    async def test_date_server_headers(self):
+        self.protocol.data_received(b'GET /a HTTP/1.1\r\n\r\n')
+        await self.wait_requests()
+
+        response = bytes(self.transport.data)
+        self.assertEqual(response.count(b'\r\nDate: '), 1)
+        self.assertEqual(response.count(b'\r\nServer: '), 1)
+
+    async def test_app_date_server_headers(self):
+
+        def app(environ, start_response):
+            start_response('200 OK', [('Date', 'Mon, 01 Jan 2018 00:00:00 GMT'), ('Server', 'app'),
+                                      ('Content-Length', '0')])
+            return []
+
+        self.protocol.app = app
+        self.protocol.data_received(b'GET /a HTTP/1.1\r\n\r\n')
+        await self.wait_requests()
+
+        response = bytes(self.transport.data)
+        self.assertEqual(response.count(b'\r\nDate: '), 1)
+        self.assertIn(b'\r\nDate: Mon, 01 Jan 2018 00:00:00 GMT\r\n', response)
+        self.assertEqual(response.count(b'\r\nServer: '), 1)
+        self.assertIn(b'\r\nServer: app\r\n', response)
+
+    async def test_head(self):
+        self.protocol.data_received(b'HEAD /a HTTP/1.1\r\n\r\n')
+        await self.wait_requests()
+
+        self.assertTrue(bytes(self.transport.data).endswith(b'\r\n\r\n'))
+
+    async def test_error(self):
+        self.protocol.data_received(b'GET /error HTTP/1.1\r\n\r\n')
+        await self.wait_requests()
+
+        self.assertTrue(bytes(self.transport.data).startswith(b'HTTP/1.1 500 INTERNAL SERVER ERROR\r\n'))
+        self.assertTrue(self.transport.closed)
+
+    async def test_bad_request_after_pipelined(self):
+        self.protocol.data_received(b'GET /a HTTP/1.1\r\n\r\nFOO\r\n\r\n')
+        await self.wait_requests()
+
+        response = bytes(self.transport.data)
+        self.assertTrue(response.startswith(b'HTTP/1.1 200 OK\r\n'))
+        self.assertTrue(response.endswith(b'HTTP/1.1 400 Bad Request\r\nConnection: close\r\n'
+                                          b'Content-Length: 0\r\n\r\n'))
+        self.assertTrue(self.transport.closed)
+
+    async def test_chunked_body(self):
+        from werkzeug.wrappers import Request
+
+        def app(environ, start_response):
+            body = Request(environ).get_data()
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return [body]
+
+        parser_classes = [PyHttpRequestParser]
+        if httptools is not None:
+            parser_classes.append(httptools.HttpRequestParser)
+
+        for parser_class in parser_classes:
+            transport = FakeTransport()
+            protocol = WSGIServerProtocol(app, loop=self.loop)
+            protocol.parser_class = parser_class
+            protocol.connection_made(transport)
+
+            protocol.data_received(b'POST /a HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n'
+                                   b'3\r\nfoo\r\n0\r\n\r\n')
+            while protocol.handler is not None:
+                await asyncio.sleep(0)
+            protocol.connection_lost(None)
+
+            self.assertTrue(bytes(transport.data).endswith(b'\r\n\r\n3\r\nfoo\r\n0\r\n\r\n'))
+
+    async def test_chunked_with_content_length(self):
+        self.protocol.data_received(b'POST /a HTTP/1.1\r\nTransfer-Encoding: chunked\r\nContent-Length: 4\r\n\r\n'
+                                    b'3\r\nfoo\r\n0\r\n\r\n')
+        await self.wait_requests()
+
+        self.assertEqual(bytes(self.transport.data), b'HTTP/1.1 400 Bad Request\r\nConnection: close\r\n'
+                                                     b'Content-Length: 0\r\n\r\n')
+        self.assertEqual(self.environs, [])
+
+    async def test_coroutine_app(self):
+
+        async def app(environ, start_response):
+            await asyncio.sleep(0)
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return [b'async']
+
+        self.protocol.app = app
+        self.protocol.data_received(b'GET /a HTTP/1.1\r\n\r\n')
+        await self.wait_requests()
+
+        response = bytes(self.transport.data)
+        self.assertTrue(response.startswith(b'HTTP/1.1 200 OK\r\n'))
+        self.assertIn(b'5\r\nasync\r\n', response)
+
+    async def test_connection_lost_before_handling(self):
+        self.protocol.data_received(b'GET /a HTTP/1.1\r\n\r\n')
+        handler = self.protocol.handler
+        # Request is taken from queue, but its task does not start before connection is lost.
+        await asyncio.sleep(0)
+        self.protocol.connection_lost(None)
+        await handler
+
+        self.assertIsNone(handler.exception())
+        self.assertEqual(self.environs, [])
+        self.assertEqual(bytes(self.transport.data), b'')
+
+    async def test_continue(self):
+        self.protocol.data_received(b'POST /a HTTP/1.1\r\nExpect: 100-continue\r\nContent-Length: 3\r\n\r\n')
+        self.assertEqual(bytes(self.transport.data), b'HTTP/1.1 100 Continue\r\n\r\n')
+
+        self.protocol.data_received(b'foo')
+        await self.wait_requests()
+        self.assertTrue(bytes(self.transport.data).endswith(b'3\r\nfoo\r\n0\r\n\r\n'))
+
+    async def test_continue_after_pipelined(self):
+        self.protocol.data_received(b'GET /a HTTP/1.1\r\n\r\nPOST /b HTTP/1.1\r\n'
+                                    b'Expect: 100-continue\r\nContent-Length: 3\r\n\r\n')
+        self.assertEqual(bytes(self.transport.data), b'')
+        await self.wait_requests()
+
+        response = bytes(self.transport.data)
+        self.assertTrue(response.startswith(b'HTTP/1.1 200 OK\r\n'))
+        self.assertTrue(response.endswith(b'0\r\n\r\nHTTP/1.1 100 Continue\r\n\r\n'))
+
+        self.protocol.data_received(b'foo')
+        await self.wait_requests()
+        self.assertEqual([e['PATH_INFO'] for e in self.environs], ['/a', '/b'])
+
+    async def test_body_too_large(self):
+        self.protocol.max_request_body_size = 4
+        self.protocol.data_received(b'POST /a HTTP/1.1\r\nContent-Length: 5\r\n\r\n')
+        await self.wait_requests()
+
+        self.assertEqual(bytes(self.transport.data), b'HTTP/1.1 413 Request Entity Too Large\r\n'
+                                                     b'Connection: close\r\nContent-Length: 0\r\n\r\n')
+        self.assertTrue(self.transport.closed)
+        self.assertEqual(self.environs, [])
+
+    async def test_chunked_body_too_large(self):
+        self.protocol.max_request_body_size = 4
+        self.protocol.data_received(b'POST /a HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n'
+                                    b'3\r\nfoo\r\n3\r\nbar\r\n0\r\n\r\n')
+        await self.wait_requests()
+
+        self.assertTrue(bytes(self.transport.data).startswith(b'HTTP/1.1 413 Request Entity Too Large\r\n'))
+        self.assertTrue(self.transport.closed)
+
+    @skipIf(httptools is None, 'httptools is not installed')
+    async def test_upgrade(self):
+        protocol = WSGIServerProtocol(self.app, loop=self.loop)
+        protocol.parser_class = httptools.HttpRequestParser
+        protocol.connection_made(self.transport)
+
+        protocol.data_received(b'GET /a HTTP/1.1\r\nConnection: Upgrade\r\nUpgrade: websocket\r\n\r\n\x81\x00')
+        while protocol.handler is not None:
+            await asyncio.sleep(0)
+
+        response = bytes(self.transport.data)
+        self.assertTrue(response.startswith(b'HTTP/1.1 200 OK\r\n'))
+        self.assertIn(b'2\r\n/a\r\n', response)
+        self.assertTrue(self.transport.closed)
+
+
+class AdmissionControllerTest(TestCase):
+
+    use_default_loop = True
+
+    def setUp(self):
+        self.paths = []
+        self.transport = FakeTransport()
+        self.admission = AdmissionController(max_pending=2, max_lag=0.5, retry_after=3)
+        self.protocol = WSGIServerProtocol(self.app, loop=self.loop, admission=self.admission)
+        self.protocol.parser_class = PyHttpRequestParser
+        self.protocol.connection_made(self.transport)
+
+    def tearDown(self):
+        self.protocol.connection_lost(None)
+        self.admission.stop()
+
+    def app(self, environ, start_response):
+        self.paths.append(environ['PATH_INFO'])
+        start_response('200 OK', [('Content-Type', 'text/plain'), ('Content-Length', '2')])
+        return [b'ok']
+
+    async def wait_requests(self):
+        while self.protocol.handler is not None:
+            await asyncio.sleep(0)
+
+    async def test_max_pending(self):
+        self.protocol.data_received(b'GET /a HTTP/1.1\r\n\r\nGET /b HTTP/1.1\r\n\r\nGET /c HTTP/1.1\r\n\r\n')
+        await self.wait_requests()
+
+        self.assertEqual(self.paths, ['/a', '/b'])
+        response = bytes(self.transport.data)
+        self.assertLess(response.rindex(b'HTTP/1.1 200 OK\r\n'),
+                        response.index(b'HTTP/1.1 503 SERVICE UNAVAILABLE\r\n'))
+        self.assertIn(b'Retry-After: 3\r\n', response)
+        self.assertEqual(self.admission.rejected, 1)
+        self.assertEqual(self.admission.pending, 0)
+        self.assertFalse(self.transport.closed)
+
+    async def test_lag(self):
+        self.admission.lag = 1
+        self.protocol.data_received(b'GET /a HTTP/1.1\r\n\r\n')
+        await self.wait_requests()
+
+        self.assertEqual(self.paths, [])
+        self.assertTrue(bytes(self.transport.data).startswith(b'HTTP/1.1 503 SERVICE UNAVAILABLE\r\n'))
+
+    async def test_deadline_passed(self):
+        self.protocol.data_received(b'GET /a HTTP/1.1\r\nX-Request-Deadline: 1000\r\n\r\n'
+                                    b'GET /b HTTP/1.1\r\nX-Request-Deadline: 99999999999\r\n\r\n')
+        await self.wait_requests()
+
+        self.assertEqual(self.paths, ['/b'])
+        self.assertEqual(self.admission.dropped, 1)
+        self.assertNotIn(b'Retry-After', bytes(self.transport.data))
+
+    async def test_measure_lag(self):
+        self.admission.loop = self.loop
+        self.admission._expected = self.loop.time() - 1
+        self.admission._measure_lag()
+
+        self.assertGreaterEqual(self.admission.lag, 1)
+        self.assertTrue(self.admission.is_overloaded())
+
+
+class LoadSSLContextTest(SyncTestCase):
+
+    def test_ssl_context(self):
+        ctx = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        self.assertIs(load_ssl_context(ctx), ctx)
+
+    def test_invalid(self):
+        with self.assertRaises(TypeError):
+            load_ssl_context('foo')
+
+
+CERT_FILE = os.path.join(os.path.dirname(__file__), 'certs', 'localhost.crt')
+KEY_FILE = os.path.join(os.path.dirname(__file__), 'certs', 'localhost.key')
+
+
+class TLSServerTest(TestCase):
+
+    use_default_loop = True
+
+    def setUp(self):
+        self.metrics = HandshakeMetrics()
+        self.client_ctx = ssl.create_default_context(cafile=CERT_FILE)
+
+    def app(self, environ, start_response):
+        body = environ['wsgi.url_scheme'].encode()
+        start_response('200 OK', [('Content-Type', 'text/plain'), ('Content-Length', str(len(body)))])
+        return [body]
+
+    def fetch(self, port, session=None):
+        with socket.create_connection(('127.0.0.1', port)) as sock:
+            with self.client_ctx.wrap_socket(sock, server_hostname='localhost', session=session) as tls:
+                tls.sendall(b'GET / HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n')
+                response = b''
+                data = tls.recv(4096)
+                while data:
+                    response += data
+                    data = tls.recv(4096)
+                return response, tls.session, tls.session_reused
+
+    async def test_make_server(self):
+        server = await make_server('127.0.0.1', 0, self.app, ssl_context=(CERT_FILE, KEY_FILE),
+                                   loop=self.loop, handshake_metrics=self.metrics)
+        try:
+            port = server.sockets[0].getsockname()[1]
+            response, session, reused = await self.loop.run_in_executor(None, self.fetch, port)
+            self.assertFalse(reused)
+            self.assertTrue(response.startswith(b'HTTP/1.1 200 OK\r\n'))
+            self.assertTrue(response.endswith(b'\r\n\r\nhttps'))
+
+            response, _, reused = await self.loop.run_in_executor(None, self.fetch, port, session)
+            self.assertTrue(reused)
+            self.assertTrue(response.endswith(b'\r\n\r\nhttps'))
+        finally:
+            server.close()
+            await server.wait_closed()
+
+        metrics = self.metrics.as_dict()
+        self.assertEqual(metrics['full_handshakes'], 1)
+        self.assertEqual(metrics['resumed_handshakes'], 1)
+
+    def test_load_cert_files(self):
+        ctx = load_ssl_context((CERT_FILE, KEY_FILE))
+
+        self.assertIsInstance(ctx, ssl.SSLContext)
+        self.assertFalse(ctx.options & ssl.OP_NO_TICKET)
+
+
+class HandshakeMetricsTest(SyncTestCase):
+
+    def test_record(self):
+        metrics = HandshakeMetrics()
+        metrics.record(0.004, False)
+        metrics.record(0.002, False)
+        metrics.record(0.001, True)
+
+        self.assertEqual(metrics.as_dict(), {'full_handshakes': 2,
+                                             'full_avg_time': 0.003,
+                                             'resumed_handshakes': 1,
+                                             'resumed_avg_time': 0.001,
+                                             'resumed_ratio': 1 / 3})
+
+
+class UnixSocketTest(TestCase):
+
+    use_default_loop = True
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.path, 'server.sock')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_get_unix_socket_path(self):
+        self.assertEqual(get_unix_socket_path('unix:/tmp/foo.sock'), '/tmp/foo.sock')
+        self.assertEqual(get_unix_socket_path('unix:///tmp/foo.sock'), '/tmp/foo.sock')
+        self.assertIsNone(get_unix_socket_path('localhost'))
+        self.assertIsNone(get_unix_socket_path(None))
+
+    def test_bind_unix_socket(self):
+        bind_unix_socket(self.socket_path).close()
+        sock = bind_unix_socket(self.socket_path, mode=0o600)
+        sock.close()
+
+        self.assertEqual(stat.S_IMODE(os.stat(self.socket_path).st_mode), 0o600)
+
+    async def test_make_server(self):
+
+        def app(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/plain'), ('Content-Length', '2')])
+            return [b'ok']
+
+        server = await make_server('unix:' + self.socket_path, None, app, loop=self.loop)
+        try:
+            reader, writer = await asyncio.open_unix_connection(self.socket_path)
+            writer.write(b'GET / HTTP/1.1\r\nConnection: close\r\n\r\n')
+            response = await reader.read()
+            writer.close()
+        finally:
+            server.close()
+
+        self.assertTrue(response.startswith(b'HTTP/1.1 200 OK\r\n'))
+        self.assertTrue(response.endswith(b'\r\n\r\nok'))
+
+
+class SystemdSocketsTest(SyncTestCase):
+
+    def test_not_activated(self):
+        with patch.dict(os.environ, {'LISTEN_PID': str(os.getpid() + 1), 'LISTEN_FDS': '1'}):
+            self.assertEqual(get_systemd_sockets(), [])
+            self.assertNotIn('LISTEN_FDS', os.environ)
+
+    def test_activated(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(('127.0.0.1', 0))
+        address = listener.getsockname()
+
+        with patch.dict(os.environ, {'LISTEN_PID': str(os.getpid()), 'LISTEN_FDS': '1'}), \
+                patch('aiowerkzeug.serving.SD_LISTEN_FDS_START', listener.detach()):
+            sockets = get_systemd_sockets()
+
+        self.assertEqual(len(sockets), 1)
+        self.assertEqual(sockets[0].getsockname(), address)
+        self.assertNotIn('LISTEN_PID', os.environ)
+        sockets[0].close()